@@ -0,0 +1,46 @@
+# Compares the model construction of the Pyomo LPModel with the sparse
+# matrix builder of MatrixLPModel (build time and peak Python memory).
+#
+#   python -m energysys.benchmarks.build_matrix --units 200 --hours 168
+import argparse
+import time
+import tracemalloc
+
+from ..solvers.unit_commitment import LPModel
+from ..solvers.matrix import MatrixLPModel
+from .generators import random_load, random_system
+
+
+def measure(build):
+    tracemalloc.start()
+    start = time.perf_counter()
+    build()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Pyomo vs matrix model build benchmark")
+    parser.add_argument("--units", type=int, default=200)
+    parser.add_argument("--hours", type=int, default=168)
+    args = parser.parse_args(args)
+
+    system = random_system(args.units)
+    load = random_load(args.hours, system)
+
+    def build_matrix():
+        model = MatrixLPModel(system)
+        model._build_model(load)
+        model.problem.matrices()
+
+    print("{:<10}{:>12}{:>16}".format("backend", "build [s]", "peak mem [MB]"))
+    for name, build in (("pyomo", lambda: LPModel(system)._build_model(load)),
+                        ("matrix", build_matrix)):
+        elapsed, peak = measure(build)
+        print("{:<10}{:>12.3f}{:>16.1f}".format(name, elapsed, peak / 2**20))
+
+
+if __name__ == "__main__":
+    main()
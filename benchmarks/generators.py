@@ -0,0 +1,87 @@
+import numpy as np
+
+from ..systems.core import Line, Network, UCSystem
+from ..systems.thermal import ThermalUnit
+
+
+def random_system(n_units, seed=0, reserve_req=.1, types=None):
+    # With types, the units are copies of that many random designs, as in
+    # fleets of identical units
+    rng = np.random.default_rng(seed)
+    units = []
+    for i in range(n_units):
+        if types is not None and i >= types:
+            u = units[i % types]
+            units.append(ThermalUnit("Unit{}".format(i), list(u.curve), u.fuel_cost, min_power=u.min_power,
+                                     max_power=u.max_power, start_up_cost=u.start_up_cost, ramp_up=u.ramp_up,
+                                     ramp_down=u.ramp_down, min_uptime=u.min_uptime, min_rest=u.min_rest))
+            continue
+        min_power = rng.uniform(20, 100)
+        max_power = min_power + rng.uniform(100, 400)
+        units.append(ThermalUnit("Unit{}".format(i),
+                                 [rng.uniform(100, 800), rng.uniform(7, 13), rng.uniform(.01, .03)],
+                                 rng.uniform(.8, 1.1), min_power=min_power, max_power=max_power,
+                                 start_up_cost=rng.uniform(50, 500),
+                                 ramp_up=.5 * max_power, ramp_down=.5 * max_power,
+                                 min_uptime=int(rng.integers(1, 6)), min_rest=int(rng.integers(1, 6))))
+    return UCSystem(units, reserve_req=reserve_req)
+
+
+def _radial_arcs(n_buses, rng):
+    # Random tree: every bus hangs from one of the buses before it
+    return [(int(rng.integers(0, b)), b) for b in range(1, n_buses)]
+
+
+def _grid_arcs(n_buses):
+    # Lattice of about sqrt(n) x sqrt(n) buses, row by row
+    width = int(np.ceil(np.sqrt(n_buses)))
+    arcs = []
+    for b in range(n_buses):
+        if (b + 1) % width and b + 1 < n_buses:
+            arcs.append((b, b + 1))
+        if b + width < n_buses:
+            arcs.append((b, b + width))
+    return arcs
+
+
+def random_network(system, n_buses, topology='meshed', n_lines=None, seed=0, congestion=.3):
+    # Network of n_buses over the units of system. 'radial' is a random
+    # tree, 'meshed' a tree plus random chords up to n_lines (1.5 lines per
+    # bus by default) and 'grid' a square lattice. Line limits are a share
+    # of the fleet capacity, smaller with more congestion.
+    rng = np.random.default_rng(seed)
+    if topology == 'radial':
+        arcs = _radial_arcs(n_buses, rng)
+    elif topology == 'meshed':
+        arcs = _radial_arcs(n_buses, rng)
+        n_lines = int(1.5 * n_buses) if n_lines is None else n_lines
+        existing = set(arcs)
+        while len(arcs) < min(n_lines, n_buses * (n_buses - 1) // 2):
+            a, b = sorted(int(x) for x in rng.choice(n_buses, 2, replace=False))
+            if (a, b) not in existing:
+                existing.add((a, b))
+                arcs.append((a, b))
+    elif topology == 'grid':
+        arcs = _grid_arcs(n_buses)
+    else:
+        raise ValueError("Unknown topology {}".format(topology))
+
+    capacity = sum(u.max_power for u in system)
+    limit = capacity / max(n_buses, 1) * (1 - congestion) * 4
+    lines = [Line(arc, power_lim=limit * rng.uniform(.5, 1.5), Z=rng.uniform(5, 20)) for arc in arcs]
+    links = [(int(rng.integers(0, n_buses)), u.name) for u in system]
+    return Network(lines, system, links)
+
+
+def random_load(T, system, buses=None, seed=0, level=.6, noise=.05):
+    # Daily shaped load at level times the fleet capacity, as an array of
+    # length T, or a {bus: array} split with random shares over buses
+    rng = np.random.default_rng(seed)
+    capacity = sum(u.max_power for u in system)
+    hours = np.arange(T)
+    shape = 1 + .2 * np.sin(2 * np.pi * (hours - 8) / 24) + noise * rng.standard_normal(T)
+    load = level * capacity * np.clip(shape, .5, None) / 1.2
+    if buses is None:
+        return load
+    shares = rng.dirichlet(np.ones(len(buses)))
+    return {b: load * s for b, s in zip(buses, shares)}
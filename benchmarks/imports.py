@@ -0,0 +1,104 @@
+# Start up cost of the entry points of the package: import time in a fresh
+# interpreter, the heavy dependencies each one loads, and the time for a
+# spawned worker process to import it and run its first task.
+#
+#   python -m energysys.benchmarks.imports --repeat 5 --spawn
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+PACKAGE = __package__.rsplit('.', 1)[0]
+
+# Statement of each entry point, {p} being the package
+ENTRY_POINTS = {
+    'ThermalUnit': 'from {p}.systems.thermal import ThermalUnit',
+    'Network': 'from {p}.systems.core import Network',
+    'LambdaIteration': 'from {p}.solvers.economic_dispatch import LambdaIteration',
+    'MultiPeriodDispatch': 'from {p}.solvers.economic_dispatch import MultiPeriodDispatch',
+    'PriorityListModel': 'from {p}.solvers.priority_list import PriorityListModel',
+    'LagrangianModel': 'from {p}.solvers.lagrangian import LagrangianModel',
+    'RollingHorizon': 'from {p}.solvers.rolling import RollingHorizon',
+    'MatrixLPModel': 'from {p}.solvers.matrix import MatrixLPModel',
+    'LPModel': 'from {p}.solvers.unit_commitment import LPModel',
+    'ClusteredLPModel': 'from {p}.solvers.clustered import ClusteredLPModel',
+    'LPModel()': 'from {p}.solvers.unit_commitment import LPModel; from {p}.systems.core import UCSystem; '
+                 'LPModel(UCSystem([]))',
+    'ScenarioRunner': 'from {p}.solvers.scenarios import ScenarioRunner',
+    'load_scenarios': 'from {p}.utils.loads import load_scenarios',
+}
+
+HEAVY = ['pyomo', 'pandas', 'matplotlib', 'pyarrow', 'scipy.optimize', 'scipy.sparse', 'scipy.signal']
+
+_PROBE = """
+import sys, time, json
+start = time.perf_counter()
+{statement}
+elapsed = time.perf_counter() - start
+print(json.dumps({{'time': elapsed, 'heavy': [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+
+def _environment():
+    # The child interpreters find the package where this one does
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(p or os.getcwd() for p in sys.path)
+    return env
+
+
+def import_time(statement, repeat=5):
+    # Median import time of statement over fresh interpreters, and the heavy
+    # modules it loaded
+    code = _PROBE.format(statement=statement, heavy=HEAVY)
+    env = _environment()
+    times = []
+    for _ in range(repeat):
+        out = subprocess.run([sys.executable, '-c', code], env=env, capture_output=True, text=True, check=True)
+        record = json.loads(out.stdout.strip().splitlines()[-1])
+        times.append(record['time'])
+    return statistics.median(times), record['heavy']
+
+
+def _task(statement):
+    exec(statement, {})
+    return os.getpid()
+
+
+def spawn_time(statement):
+    # Time for a spawned pool worker to start, import and return its first task
+    start = time.perf_counter()
+    with ProcessPoolExecutor(1, mp_context=get_context('spawn')) as pool:
+        pool.submit(_task, statement).result()
+        return time.perf_counter() - start
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Import time of the package entry points")
+    parser.add_argument("--entry-points", nargs='+', default=list(ENTRY_POINTS), choices=list(ENTRY_POINTS))
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--spawn", action='store_true', help="also time a spawned worker")
+    parser.add_argument("--output", default=None, help=".json")
+    args = parser.parse_args(args)
+
+    records = []
+    for name in args.entry_points:
+        statement = ENTRY_POINTS[name].format(p=PACKAGE)
+        elapsed, heavy = import_time(statement, args.repeat)
+        record = {'entry_point': name, 'import_time': elapsed, 'heavy': heavy}
+        if args.spawn:
+            record['spawn_time'] = spawn_time(statement)
+        records.append(record)
+        spawn = " spawn={:.3f}".format(record['spawn_time']) if args.spawn else ""
+        print("{:<20} import={:.3f}{} {}".format(name, elapsed, spawn, " ".join(heavy)))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(records, f, indent=1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,230 @@
+# Build and solve scaling benchmark of the solvers on synthetic systems.
+# Each case runs in a fresh process so that its peak RSS is its own. The
+# JSON output also has the build phases and solver calls of each case.
+#
+#   python -m energysys.benchmarks.runner --solvers lp matrix_lp lambda \
+#       --units 10 50 100 --buses 10 --hours 24 168 --backend highs --output results.csv
+import argparse
+import csv
+import itertools
+import json
+import multiprocessing
+import os
+import shutil
+import time
+
+from .generators import random_load, random_network, random_system
+from ..solvers.backends import get_backend
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+SOLVERS = ['lp', 'lp_warm', 'clustered', 'dc', 'scdc', 'qp', 'qpscipy', 'lambda', 'multi_ed', 'priority_list',
+           'lagrangian', 'matrix_lp', 'matrix_dc']
+NETWORK_SOLVERS = ['dc', 'scdc', 'matrix_dc']
+
+
+def _peak_rss():
+    # Peak resident set size of this process in MB
+    if resource is None:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _pyomo_case(model, build, backend, warmstart=False, refined=False):
+    # With refined, the solve is _solve_refined, with what follows the
+    # first solve of the model
+    start = time.perf_counter()
+    build()
+    build_time = time.perf_counter() - start
+    record = {'build_time': build_time,
+              'variables': model.m.nvariables(), 'constraints': model.m.nconstraints()}
+    if backend is not None:
+        start = time.perf_counter()
+        solve = model._solve_refined if refined else model._solve_model
+        record['status'] = solve(0, backend, warmstart)
+        record['solve_time'] = time.perf_counter() - start
+    report = model.report.to_dict()
+    record.update(phases=report['phases'], solves=report['solves'])
+    return record
+
+
+def _matrix_case(model, load):
+    start = time.perf_counter()
+    model._build_model(load)
+    build_time = time.perf_counter() - start
+    start = time.perf_counter()
+    status, _ = model._solve_problem()
+    report = model.report.to_dict()
+    return {'build_time': build_time, 'solve_time': time.perf_counter() - start, 'status': status,
+            'variables': model.problem.num_vars, 'constraints': model.problem.num_rows,
+            'phases': report['phases'], 'solves': report['solves']}
+
+
+def run_case(solver, units, buses, hours, topology, seed, backend, ipopt, types=None):
+    from ..solvers import clustered, economic_dispatch, lagrangian, matrix, priority_list, unit_commitment
+
+    system = random_system(units, seed=seed, types=types)
+    network = random_network(system, buses, topology=topology, seed=seed)
+    load = random_load(hours, system, seed=seed)
+    bus_load = random_load(hours, system, buses=network.buses, seed=seed)
+    record = {}
+    if solver == 'lp':
+        model = unit_commitment.LPModel(system)
+        record = _pyomo_case(model, lambda: model._build_model(load), backend)
+    elif solver == 'lp_warm':
+        # Started from the priority list commitment, whose time is the
+        # heuristic_time
+        start = time.perf_counter()
+        heuristic = priority_list.PriorityListModel(system)
+        heuristic.solve(load)
+        heuristic_time = time.perf_counter() - start
+        model = unit_commitment.LPModel(system)
+        heuristic.warm_start(model)
+
+        def build():
+            model._build_model(load)
+            model._set_start(model.start, model.start_power)
+        record = _pyomo_case(model, build, backend, warmstart=True)
+        record['heuristic_time'] = heuristic_time
+    elif solver == 'clustered':
+        # Integers per group of identical units, as many as --types, and
+        # the dispatch of the units
+        model = clustered.ClusteredLPModel(system)
+        record = _pyomo_case(model, lambda: model._build_model(load), backend, refined=True)
+        record['groups'] = len(model.clustering.members)
+    elif solver == 'dc':
+        model = unit_commitment.DCModel(network)
+        record = _pyomo_case(model, lambda: model._build_model(bus_load), backend)
+    elif solver == 'scdc':
+        model = unit_commitment.SCDCModel(network)
+        record = _pyomo_case(model, lambda: model._build_model(bus_load, 'all'), backend)
+    elif solver == 'matrix_lp':
+        record = _matrix_case(matrix.MatrixLPModel(system), load)
+    elif solver == 'matrix_dc':
+        record = _matrix_case(matrix.MatrixDCModel(network), bus_load)
+    elif solver == 'lambda':
+        start = time.perf_counter()
+        economic_dispatch.LambdaIteration().solve_batch(system, load)
+        record = {'solve_time': time.perf_counter() - start, 'status': True,
+                  'variables': units * hours, 'constraints': hours}
+    elif solver == 'multi_ed':
+        start = time.perf_counter()
+        model = economic_dispatch.MultiPeriodDispatch()
+        model.solve(system, load)
+        record = {'solve_time': time.perf_counter() - start, 'status': model.status,
+                  'variables': units * hours, 'constraints': hours + units * (hours - 1)}
+    elif solver == 'priority_list':
+        start = time.perf_counter()
+        model = priority_list.PriorityListModel(system)
+        status, _ = model.solve(load)
+        record = {'solve_time': time.perf_counter() - start, 'status': status,
+                  'variables': units * hours, 'constraints': 2 * hours,
+                  'solves': model.report.to_dict()['solves']}
+    elif solver == 'lagrangian':
+        start = time.perf_counter()
+        model = lagrangian.LagrangianModel(system)
+        status, _ = model.solve(load)
+        record = {'solve_time': time.perf_counter() - start, 'status': status, 'gap': model.gap,
+                  'variables': units * hours, 'constraints': 2 * hours,
+                  'solves': model.report.to_dict()['solves']}
+    elif solver == 'qpscipy':
+        # Single period dispatches
+        start = time.perf_counter()
+        model = economic_dispatch.QPScipy()
+        model.solve(system, load[0])
+        record = {'solve_time': time.perf_counter() - start, 'status': model.res.success,
+                  'variables': units, 'constraints': 1}
+    elif solver == 'qp' and ipopt is not None:
+        start = time.perf_counter()
+        economic_dispatch.QPModel().solve(system, load[0], 'ipopt', ipopt)
+        record = {'solve_time': time.perf_counter() - start, 'variables': units, 'constraints': 1}
+    record['peak_rss'] = _peak_rss()
+    return record
+
+
+def _child(conn, case):
+    try:
+        conn.send(run_case(**case))
+    except Exception as e:
+        conn.send({'error': repr(e)})
+    conn.close()
+
+
+def run(cases, timeout=None):
+    # Runs every case in its own process and yields the case merged with
+    # its measurements
+    ctx = multiprocessing.get_context('spawn')
+    for case in cases:
+        parent, child = ctx.Pipe(duplex=False)
+        process = ctx.Process(target=_child, args=(child, case))
+        process.start()
+        child.close()
+        record = parent.recv() if parent.poll(timeout) else {'error': 'timeout'}
+        process.kill()
+        process.join()
+        yield dict(case, **record)
+
+
+def sweep(solvers, units, buses, hours, topology='meshed', seed=0, backend=None, ipopt=None, types=None):
+    for solver, u, b, h in itertools.product(solvers, units, buses, hours):
+        if solver not in NETWORK_SOLVERS and b != buses[0]:
+            continue
+        # Without --types no two units are identical, clustered is lp
+        if solver == 'clustered' and types is None:
+            continue
+        yield {'solver': solver, 'units': u, 'buses': b, 'hours': h, 'topology': topology,
+               'seed': seed, 'backend': backend, 'ipopt': ipopt, 'types': types}
+
+
+def write(records, path):
+    fields = ['solver', 'units', 'types', 'groups', 'buses', 'hours', 'topology', 'seed', 'build_time', 'solve_time',
+              'heuristic_time', 'variables', 'constraints', 'peak_rss', 'status', 'error']
+    if path.endswith('.json'):
+        with open(path, 'w') as f:
+            json.dump(records, f, indent=1)
+    else:
+        with open(path, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fields, extrasaction='ignore')
+            writer.writeheader()
+            writer.writerows(records)
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Build and solve scaling benchmark")
+    parser.add_argument("--solvers", nargs='+', default=SOLVERS, choices=SOLVERS)
+    parser.add_argument("--units", nargs='+', type=int, default=[10, 50])
+    parser.add_argument("--buses", nargs='+', type=int, default=[10])
+    parser.add_argument("--hours", nargs='+', type=int, default=[24])
+    parser.add_argument("--topology", default='meshed', choices=['radial', 'meshed', 'grid'])
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--types", type=int, default=None,
+                        help="number of distinct unit designs, the fleets being copies of them")
+    parser.add_argument("--backend", default=None,
+                        help="solver name or executable of the Pyomo models, HiGHS in process by default")
+    parser.add_argument("--build-only", action='store_true', help="only build the Pyomo models")
+    parser.add_argument("--ipopt", default=shutil.which('ipopt'), help="Ipopt executable for QPModel")
+    parser.add_argument("--timeout", type=float, default=None, help="seconds per case")
+    parser.add_argument("--output", default='benchmark.csv', help=".csv or .json")
+    args = parser.parse_args(args)
+
+    backend = None if args.build_only else args.backend or get_backend().name
+    if backend is not None and os.path.exists(backend):
+        backend = os.path.abspath(backend)
+    ipopt = os.path.abspath(args.ipopt) if args.ipopt else None
+    records = []
+    for record in run(sweep(args.solvers, args.units, args.buses, args.hours,
+                            args.topology, args.seed, backend, ipopt, args.types), args.timeout):
+        records.append(record)
+        measures = ("{}={:.3f}".format(k, record[k]) for k in ('build_time', 'solve_time', 'peak_rss')
+                    if record.get(k) is not None)
+        print("{solver:<10} units={units:<5} buses={buses:<5} hours={hours:<5}".format(**record),
+              *measures, record.get('error', ''))
+    write(records, args.output)
+
+
+if __name__ == "__main__":
+    main()
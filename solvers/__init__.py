@@ -0,0 +1,42 @@
+import importlib
+
+# Models by name, their module imported on first access only, so that e.g.
+# LambdaIteration does not load Pyomo:
+#
+#   from energysys.solvers import LambdaIteration
+_EXPORTS = {
+    'LambdaIteration': '.economic_dispatch',
+    'MultiPeriodDispatch': '.economic_dispatch',
+    'QPScipy': '.economic_dispatch',
+    'QPModel': '.economic_dispatch',
+    'LPModel': '.unit_commitment',
+    'DCModel': '.unit_commitment',
+    'SCDCModel': '.unit_commitment',
+    'ClusteredLPModel': '.clustered',
+    'MatrixLPModel': '.matrix',
+    'MatrixDCModel': '.matrix',
+    'PriorityListModel': '.priority_list',
+    'LagrangianModel': '.lagrangian',
+    'RollingHorizon': '.rolling',
+    'ScenarioRunner': '.scenarios',
+    'Results': '.results',
+    'ResultsWriter': '.results',
+    'RunReport': '.report',
+    'SolverBackend': '.backends',
+    'AppsiBackend': '.backends',
+    'FileBackend': '.backends',
+    'get_backend': '.backends',
+    'ResultCache': '.cache',
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name):
+    if name not in _EXPORTS:
+        raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+    return getattr(importlib.import_module(_EXPORTS[name], __name__), name)
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
@@ -0,0 +1,146 @@
+import importlib.util
+import os
+import shutil
+import time
+
+from .report import appsi_stats, pyomo_stats
+
+
+class SolverBackend(object):
+    # MIP solver of the Pyomo models. gap is the relative MIP gap at which
+    # the search stops, time_limit in seconds, threads None for the solver
+    # default, options solver specific options passed on as they are.
+    # solve(m, tee, warmstart) returns the status (optimal) and the
+    # SolveStats of the call and loads the solution into m. With warmstart
+    # the values of the variables of m are the incumbent to start from.
+    name = None
+
+    def __init__(self, gap=0.01, time_limit=200, threads=None, options=None):
+        self.gap = gap
+        self.time_limit = time_limit
+        self.threads = threads
+        self.options = dict(options or {})
+
+    def solve(self, m, tee=False, warmstart=False):
+        raise NotImplementedError
+
+
+class AppsiBackend(SolverBackend):
+    # Pyomo APPSI persistent interface: the model is handed to the solver
+    # library in memory, without LP or solution files. The solver keeps the
+    # model of the last call and, when solving the same model again, only
+    # sends what changed (new cuts, mutable parameters of a persistent
+    # model). 'highs' runs HiGHS in process through highspy, 'gurobi' needs
+    # gurobipy. A backend holds one solver: share it between models, not
+    # between threads.
+    SOLVERS = {
+        'highs': ('Highs', 'highs_options', 'threads'),
+        'gurobi': ('Gurobi', 'gurobi_options', 'Threads'),
+    }
+
+    def __init__(self, name='highs', **kwargs):
+        if name not in self.SOLVERS:
+            raise ValueError("Unknown APPSI solver {}, use one of {}".format(name, list(self.SOLVERS)))
+        super(AppsiBackend, self).__init__(**kwargs)
+        self.name = name
+        self._solver = None
+
+    def __getstate__(self):
+        # The solver library objects stay in their process
+        state = self.__dict__.copy()
+        state['_solver'] = None
+        return state
+
+    def available(self):
+        return bool(self._get_solver().available())
+
+    def _get_solver(self):
+        if self._solver is None:
+            from pyomo.contrib.appsi import solvers
+            cls, options, threads = self.SOLVERS[self.name]
+            self._solver = getattr(solvers, cls)()
+            solver_options = dict(self.options)
+            if self.threads is not None:
+                solver_options[threads] = self.threads
+            setattr(self._solver, options, solver_options)
+        return self._solver
+
+    def solve(self, m, tee=False, warmstart=False):
+        from pyomo.contrib.appsi.base import TerminationCondition
+        from pyomo.environ import Suffix
+        solver = self._get_solver()
+        config = solver.config
+        config.stream_solver = bool(tee)
+        config.load_solution = False
+        config.mip_gap = self.gap
+        config.time_limit = self.time_limit
+        if hasattr(config, 'warmstart'):
+            config.warmstart = warmstart
+        start = time.perf_counter()
+        res = solver.solve(m)
+        wall_time = time.perf_counter() - start
+        status = res.termination_condition == TerminationCondition.optimal
+        if status:
+            res.solution_loader.load_vars()
+            # Duals exist for continuous models only
+            dual = getattr(m, 'dual', None)
+            if isinstance(dual, Suffix) and dual.import_enabled():
+                dual.clear()
+                try:
+                    dual.update(res.solution_loader.get_duals())
+                except RuntimeError:
+                    pass
+        return status, appsi_stats(self.name, res, wall_time)
+
+
+class FileBackend(SolverBackend):
+    # Solver executable called through Pyomo's SolverFactory, which writes
+    # the model and reads the solution back through files. The executable
+    # is found on the PATH unless given. For solvers without a library
+    # interface, e.g. CBC.
+    OPTIONS = {
+        'cbc': {'gap': 'ratio', 'time_limit': 'sec', 'threads': 'threads'},
+        'glpk': {'gap': 'mipgap', 'time_limit': 'tmlim'},
+    }
+
+    def __init__(self, name='cbc', executable=None, **kwargs):
+        super(FileBackend, self).__init__(**kwargs)
+        self.name = name
+        self.executable = executable
+
+    def available(self):
+        return (self.executable or shutil.which(self.name)) is not None
+
+    def solve(self, m, tee=False, warmstart=False):
+        from pyomo.environ import SolverFactory, SolverStatus, TerminationCondition
+        executable = self.executable or shutil.which(self.name)
+        sol = SolverFactory(self.name, executable=executable) if executable else SolverFactory(self.name)
+        for option, key in self.OPTIONS.get(self.name, {}).items():
+            if getattr(self, option) is not None:
+                sol.options[key] = getattr(self, option)
+        sol.options.update(self.options)
+        start = time.perf_counter()
+        if sol.warm_start_capable():
+            res = sol.solve(m, tee=tee, warmstart=warmstart)
+        else:
+            res = sol.solve(m, tee=tee)
+        stats = pyomo_stats(self.name, res, time.perf_counter() - start)
+        status = (res.solver.status == SolverStatus.ok) and (res.solver.termination_condition == TerminationCondition.optimal)
+        return status, stats
+
+
+def get_backend(solver=None, **kwargs):
+    # SolverBackend of solver: a backend, a name ('highs', 'gurobi',
+    # 'cbc', 'glpk'), a path to a solver executable, or None for HiGHS in
+    # process when highspy is installed and CBC otherwise. kwargs are the
+    # options of a new backend (gap, time_limit, threads, options).
+    if isinstance(solver, SolverBackend):
+        return solver
+    if solver is None:
+        solver = 'highs' if importlib.util.find_spec('highspy') else 'cbc'
+    if solver in AppsiBackend.SOLVERS:
+        return AppsiBackend(solver, **kwargs)
+    if os.path.sep in solver or (os.path.altsep and os.path.altsep in solver):
+        name = os.path.splitext(os.path.basename(solver))[0]
+        return FileBackend(name, executable=solver, **kwargs)
+    return FileBackend(solver, **kwargs)
@@ -0,0 +1,188 @@
+import hashlib
+import json
+import numbers
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from .results import Results
+
+# Bumped whenever the hashed inputs or the stored layout change, so that old
+# entries are not served
+FORMAT = 1
+
+
+def _numeric(items):
+    try:
+        return np.asarray(items).dtype.kind in 'biuf'
+    except ValueError:
+        return False
+
+
+def _item(x):
+    # numpy scalars among the labels, for json
+    return x.item()
+
+
+def _feed(h, obj):
+    # Canonical byte stream of obj: numbers of equal value hash the same
+    # whatever their type, containers by their items in a stable order and
+    # other objects (units, lines, systems, networks, solver backends) by
+    # their class and public attributes
+    if obj is None:
+        h.update(b'N')
+    elif isinstance(obj, (bool, np.bool_)):
+        h.update(b'B1' if obj else b'B0')
+    elif isinstance(obj, numbers.Real):
+        h.update(b'F' + repr(float(obj)).encode())
+    elif isinstance(obj, str):
+        h.update(b'S%d:' % len(obj) + obj.encode())
+    elif isinstance(obj, bytes):
+        h.update(b'Y%d:' % len(obj) + obj)
+    elif isinstance(obj, np.ndarray) and obj.dtype.kind in 'biuf':
+        a = np.ascontiguousarray(obj, dtype=np.float64)
+        h.update(b'A' + repr(a.shape).encode())
+        h.update(a.tobytes())
+    elif isinstance(obj, list) and obj and _numeric(obj):
+        # A load given as a list hashes as the same load as an array
+        _feed(h, np.asarray(obj))
+    elif isinstance(obj, (list, tuple, np.ndarray)):
+        h.update(b'L%d' % len(obj))
+        for item in obj:
+            _feed(h, item)
+    elif isinstance(obj, dict):
+        h.update(b'D%d' % len(obj))
+        for key, value in sorted(obj.items(), key=lambda item: repr(item[0])):
+            _feed(h, key)
+            _feed(h, value)
+    elif isinstance(obj, (set, frozenset)):
+        h.update(b'T%d' % len(obj))
+        for item in sorted(obj, key=repr):
+            _feed(h, item)
+    elif hasattr(obj, '__dict__'):
+        h.update(b'O' + type(obj).__qualname__.encode())
+        _feed(h, {k: v for k, v in vars(obj).items() if not k.startswith('_')})
+    else:
+        raise TypeError("Cannot hash {!r}".format(type(obj)))
+
+
+def input_key(*inputs):
+    # Hex SHA-256 of the inputs of a solve, stable across processes and runs
+    h = hashlib.sha256(b'energysys-cache-%d' % FORMAT)
+    _feed(h, inputs)
+    return h.hexdigest()
+
+
+class ResultCache(object):
+    # Solutions on disk by the hash of everything they depend on, one .npz
+    # (status, cost and the arrays of the Results) per entry, so that reruns
+    # and sweeps that repeat a solve skip it, model build included. Entries
+    # are written atomically and can be shared by processes. A hit refreshes
+    # the entry, eviction drops the entries unused for more than max_age
+    # seconds, then the least recently used ones until the cache is under
+    # max_bytes.
+    #
+    #   cache = ResultCache('cache', max_bytes=2**30)
+    #   model = DCModel(network, cache=cache)
+    #   status, cost = model.solve(load)   # solved, then served from the cache
+    def __init__(self, path, max_bytes=None, max_age=None):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(path, exist_ok=True)
+
+    def key(self, *inputs):
+        return input_key(*inputs)
+
+    def _file(self, key):
+        return os.path.join(self.path, key + '.npz')
+
+    def _entries(self):
+        # (last use, size, path) of every entry
+        entries = []
+        for name in os.listdir(self.path):
+            if name.endswith('.npz'):
+                try:
+                    stat = os.stat(os.path.join(self.path, name))
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, os.path.join(self.path, name)))
+        return entries
+
+    def __len__(self):
+        return len(self._entries())
+
+    def size(self):
+        return sum(size for _, size, _ in self._entries())
+
+    def get(self, key):
+        # (status, cost, Results) of key, None when missing or expired
+        path = self._file(key)
+        try:
+            if self.max_age is not None and time.time() - os.stat(path).st_mtime > self.max_age:
+                self._remove(path)
+                raise FileNotFoundError(path)
+            with np.load(path, allow_pickle=False) as data:
+                meta = json.loads(str(data['meta']))
+                results = Results(meta['T'], meta['start'])
+                for name, (labels, columns, value_name) in meta['fields'].items():
+                    if isinstance(columns, list):
+                        columns = tuple(columns)
+                    labels = [tuple(l) if isinstance(l, list) else l for l in labels]
+                    results.add(name, data[name], labels, columns, value_name)
+            os.utime(path)
+        except (FileNotFoundError, KeyError, ValueError, OSError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return meta['status'], meta['cost'], results
+
+    def put(self, key, status, cost, results):
+        arrays = {name: values for name, (values, _, _, _) in results.fields.items()}
+        meta = {'status': bool(status), 'cost': None if cost is None else float(cost),
+                'T': results.T, 'start': results.start,
+                'fields': {name: (labels, columns, value_name)
+                           for name, (_, labels, columns, value_name) in results.fields.items()}}
+        fd, tmp = tempfile.mkstemp(dir=self.path, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.savez_compressed(f, meta=np.array(json.dumps(meta, default=_item)), **arrays)
+            os.replace(tmp, self._file(key))
+        except BaseException:
+            self._remove(tmp)
+            raise
+        self.evict()
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def evict(self):
+        # Drops the expired entries, then the least recently used ones over
+        # max_bytes. Returns the number of entries removed.
+        entries = sorted(self._entries())
+        removed = 0
+        if self.max_age is not None:
+            now = time.time()
+            while entries and now - entries[0][0] > self.max_age:
+                self._remove(entries.pop(0)[2])
+                removed += 1
+        if self.max_bytes is not None:
+            total = sum(size for _, size, _ in entries)
+            while entries and total > self.max_bytes:
+                _, size, path = entries.pop(0)
+                self._remove(path)
+                total -= size
+                removed += 1
+        return removed
+
+    def clear(self):
+        for _, _, path in self._entries():
+            self._remove(path)
@@ -0,0 +1,153 @@
+import numpy as np
+
+from ..systems.clustering import UnitClustering
+from .unit_commitment import LPModel, _array
+
+
+class ClusteredLPModel(LPModel):
+    # LPModel of the groups of identical units of the system (see
+    # UnitClustering): binIsOn, binStartUp and binShutDown of a group are
+    # integer numbers of its units per period, its power, reserve and fuel
+    # totals, which removes the symmetry between the units of a group. A
+    # group of one unit keeps the binaries of LPModel, so that a fleet
+    # without identical units is LPModel itself, solved once.
+    # The numbers of units keep the min up and down times of every unit,
+    # but the ramps only hold for the totals: how far a unit can ramp
+    # depends on when it started. Each solve therefore gives the numbers to
+    # the units (UnitClustering.disaggregate) and dispatches them again in
+    # an LPModel of the system with that commitment fixed, kept in
+    # self.dispatch (None without identical units). When the ramps rule the
+    # commitment out, the LPModel is solved from it instead (self.repair is
+    # 'dispatch' or 'commitment'). The cost is that of the units, not above
+    # the cost of the groups in self.bound by more than the ramps make up.
+    # Units within rtol of each other are grouped as the tightest of them
+    # with their mean curve and costs, which is no longer exact. A fuel_cost
+    # given to solve is averaged over each group in the same way, the
+    # dispatch taking it per unit.
+    #
+    #   model = ClusteredLPModel(system, initial_state=state)
+    #   status, cost = model.solve(load)
+    #   model.get_results().wide('status')
+    def __init__(self, system, rtol=0, **kwargs):
+        super().__init__(system, **kwargs)
+        self.rtol = rtol
+        self.clustering = None
+        self.dispatch = None
+        self.repair = None
+        self.bound = None
+        self._load = self._fuel_cost = None
+
+    def _cache_inputs(self):
+        inputs = super()._cache_inputs()
+        inputs.update(rtol=self.rtol)
+        return inputs
+
+    def _model_system(self):
+        return self.clustering.system
+
+    def _count(self, u):
+        return self.clustering.count[u]
+
+    def _initial(self, u):
+        # Initial states of the groups, those of their units
+        if self.clustering is not None and u in self.clustering.count:
+            return self.clustering.initial_state.get(u)
+        return super()._initial(u)
+
+    def _build_units_equations(self):
+        import pyomo.environ as pyo
+        self.clustering = UnitClustering(self.system, self.initial_state, self.rtol)
+        super()._build_units_equations()
+        m = self.m
+        for binaries in (m.binIsOn, m.binStartUp, m.binShutDown):
+            for (t, g), var in binaries.items():
+                if self._count(g) > 1:
+                    var.domain = pyo.NonNegativeIntegers
+                    var.setub(self._count(g))
+
+    def _build_model(self, load):
+        # The load and fuel cost are kept for the dispatch
+        self._load, self._fuel_cost = load, None
+        super()._build_model(load)
+
+    def _update_parameters(self, load, fuel_cost=None):
+        m = self.m
+        if load is not None:
+            self._load = load
+            m.paramLoad.store_values(self._load_values(load))
+        self._fuel_cost = fuel_cost
+        fuel_cost = fuel_cost or {}
+        for g, units in self.clustering.members.items():
+            m.paramFuelCost[g] = np.mean([fuel_cost.get(u, self.system[u].fuel_cost) for u in units])
+        if self._reserve_req() != 0:
+            m.paramReserveReq = self._reserve_req()
+
+    def _set_start(self, on, power=None):
+        # Numbers of units on and total powers of the groups of the start
+        # commitment of the units
+        fleet = self.system.fleet
+        members = [[fleet.index[u] for u in units] for units in self.clustering.members.values()]
+        on = np.asarray(on) > .5
+        counts = np.column_stack([on[:, units].sum(axis=1) for units in members])
+        if power is not None:
+            power = np.where(on, power, 0)
+            power = np.column_stack([power[:, units].sum(axis=1) for units in members])
+        super()._set_start(counts, power)
+
+    def _solve_refined(self, tee, exec, warmstart=False):
+        # Groups of one unit are the units themselves, nothing to dispatch
+        import pyomo.environ as pyo
+        self.dispatch = self.repair = self.bound = None
+        status = super()._solve_refined(tee, exec, warmstart)
+        if status:
+            self.bound = pyo.value(self.m.cost)
+        if status and max(self.clustering.count.values()) > 1:
+            status = self._dispatch(tee, exec)
+        return status
+
+    def _dispatch(self, tee, exec):
+        # LPModel of the units with the commitment of the solution fixed,
+        # or started from it when the ramps rule it out
+        m = self.m
+        shape = (len(m.t), len(m.units))
+        with self._phase('disaggregate'):
+            on = self.clustering.disaggregate(*(np.rint(_array(var, shape))
+                                                for var in (m.binIsOn, m.binStartUp, m.binShutDown)))
+        dispatch = LPModel(self.system, initial_state=self.initial_state, solver=self.solver,
+                           num_lines=self.num_lines, fuel_tol=self.fuel_tol, max_cut_rounds=self.max_cut_rounds)
+        dispatch.reserve_req = self.reserve_req
+        dispatch._build_model(self._load)
+        if self._fuel_cost:
+            dispatch._update_parameters(None, self._fuel_cost)
+        dispatch._set_start(on)
+        binaries = [dispatch.m.binIsOn, dispatch.m.binStartUp, dispatch.m.binShutDown]
+        fixed = [var for b in binaries for var in b.values() if not var.fixed]
+        for var in fixed:
+            var.fix()
+        self.repair = 'dispatch'
+        status = dispatch._solve_refined(tee, exec)
+        if not status:
+            for var in fixed:
+                var.unfix()
+            dispatch._set_start(on)
+            self.repair = 'commitment'
+            status = dispatch._solve_refined(tee, exec, warmstart=True)
+        for stats in dispatch.report.solves:
+            self.report.solved(stats)
+        self.dispatch = dispatch if status else None
+        return status
+
+    def _objective(self):
+        if self.dispatch is None:
+            return super()._objective()
+        return self.dispatch._objective()
+
+    def _add_power(self, results):
+        if self.dispatch is None:
+            return super()._add_power(results)
+        self.dispatch._add_power(results)
+
+    def _add_status(self, results):
+        if self.dispatch is None:
+            return super()._add_status(results)
+        self.dispatch._add_status(results)
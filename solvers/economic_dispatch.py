@@ -1,36 +1,44 @@
 import numpy as np
 
-import pyomo.environ as pyo
-from scipy.optimize import Bounds, LinearConstraint, minimize
+from .results import Results
+
+# Pyomo and scipy are imported where they are used, so that LambdaIteration
+# loads with numpy only
 
 
 class QPScipy(object):
     def __init__(self):
-        res = None
+        self.res = None
 
     def solve(self, system, load, tee=0):
+        import scipy.sparse as sp
+        from scipy.optimize import Bounds, LinearConstraint, minimize
+        fleet = system.fleet
         # Variables bounds
-        bounds = Bounds([u.min_power for u in system], [u.max_power for u in system])
+        bounds = Bounds(fleet.min_power, fleet.max_power)
         # Starting point
-        x0 = np.array([u.min_power for u in system])
-        # Objective function
+        x0 = fleet.min_power.copy()
+        # Objective function, its gradient and constant diagonal Hessian
         def fobj(x):
-            return sum(u.input_output(x[i]) * u.fuel_cost for i, u in enumerate(system))
-        # Jacobian
+            return fleet.input_output(x) @ fleet.fuel_cost
         def fobj_jac(x):
-            return np.array([u.marginal_heatrate(x[i]) * u.fuel_cost for i, u in enumerate(system)])
+            return fleet.marginal_cost(x)
+        hess = sp.diags(2 * fleet.curve[:, 2] * fleet.fuel_cost)
         # Constraint
         balance = LinearConstraint(np.ones(len(x0)), [load], [np.inf])
-        self.res = minimize(fobj, x0, method='trust-constr', jac=fobj_jac,
-                constraints=[balance], options={'verbose': 1}, bounds=bounds)
+        self.res = minimize(fobj, x0, method='trust-constr', jac=fobj_jac, hess=lambda x: hess,
+                constraints=[balance], options={'verbose': 1 if tee else 0}, bounds=bounds)
+        return self.res.x
 
 
 
 class QPModel(object):
     def __init__(self):
+        import pyomo.environ as pyo
         self.m = pyo.ConcreteModel()
 
     def solve(self, system, load, solver, solver_path, tee=0):
+        import pyomo.environ as pyo
         self.m.units = pyo.Set(initialize=[u.name for u in system])
         lo = {u.name: u.min_power for u in system}
         up = {u.name: u.max_power for u in system}
@@ -51,26 +59,47 @@ class QPModel(object):
 
 
 class LambdaIteration(object):
-    def __init__(self):
+    # With a ResultCache, solve and solve_batch serve dispatches of inputs
+    # already solved from it (without history).
+    def __init__(self, cache=None):
         self.lambda_value = None
         self.history = {}
         self.systemLoad = None
+        self.cache = cache
+
+    def _cache_lookup(self, *args):
+        # Key of the dispatch of args and its cached Results
+        if self.cache is None:
+            return None, None
+        key = self.cache.key('LambdaIteration', *args)
+        hit = self.cache.get(key)
+        return key, None if hit is None else hit[2]
+
+    def _cache_store(self, key, system, powers, lambdas):
+        if key is not None:
+            powers = np.reshape(powers, (-1, len(system.fleet)))
+            results = Results(len(powers))
+            results.add('power', powers, system.fleet.names, 'Unit', 'Power')
+            results.add('lambda', np.reshape(lambdas, (-1, 1)), ['system'], 'Item', 'Lambda')
+            self.cache.put(key, True, None, results)
 
     def solve(self, system, load, MAX_ITER=15):
         self.history = {"lambda": [], "err": []}
         self.systemLoad = load
-        min_power = np.array([u.min_power for u in system])
-        max_power = np.array([u.max_power for u in system])
-        lambda_min = min(unit.marginal_cost(unit.min_power)
-                        for unit in system)
-        lambda_max = max(unit.marginal_cost(unit.max_power)
-                        for unit in system)
+        key, cached = self._cache_lookup('solve', system, load, MAX_ITER)
+        if cached is not None:
+            self.lambda_value = cached['lambda'][0, 0]
+            return cached['power'][0]
+        fleet = system.fleet
+        min_power = fleet.min_power
+        max_power = fleet.max_power
+        lambda_min = fleet.marginal_cost(min_power).min()
+        lambda_max = fleet.marginal_cost(max_power).max()
         Delta = (lambda_max - lambda_min) / 2
         self.lambda_value = lambda_min + Delta
         eps = 1
         for i in range(MAX_ITER):
-            powers = np.array([u.inv_marginal_cost(self.lambda_value)
-                               for u in system])
+            powers = fleet.inv_marginal_cost(self.lambda_value)
             # clip
             powers = np.minimum(max_power, np.maximum(min_power, powers))
             eps = sum(powers) - load
@@ -88,4 +117,300 @@ class LambdaIteration(object):
             if np.linalg.norm(powers - min_power) < 5e-2 or np.linalg.norm(powers - max_power) < 5e-2:
                 break
             
+        self._cache_store(key, system, powers, self.lambda_value)
         return powers
+
+    def solve_batch(self, system, loads, method="breakpoints", history=False, tol=1e-6, max_iter=100, bounds=None):
+        # Dispatch every load level of `loads` (any shape, e.g. [K] or [T, S])
+        # at once. Returns the powers, shaped loads.shape + (units,), and the
+        # system lambda, shaped as loads. bounds, (min_power, max_power) of
+        # shape (units,), replace the limits of the units, e.g. 0 for the
+        # units off or the reach of their ramps.
+        loads = np.asarray(loads, dtype=float)
+        fleet = system.fleet
+        min_power, max_power = (fleet.min_power, fleet.max_power) if bounds is None else bounds
+        # Unclipped response of each unit to lambda: alpha * lambda + beta
+        alpha = 1 / (2 * fleet.fuel_cost * (fleet.curve[:, 2] + 1e-7))
+        beta = -fleet.curve[:, 1] / (2 * (fleet.curve[:, 2] + 1e-7))
+
+        self.history = {}
+        key, cached = (None, None) if history else self._cache_lookup('solve_batch', system, loads, method, tol, max_iter, bounds)
+        if cached is not None:
+            self.lambda_value = cached['lambda'].reshape(loads.shape)
+            self.systemLoad = loads
+            return cached['power'].reshape(loads.shape + (len(fleet),)), self.lambda_value
+        if method == "breakpoints":
+            lambdas = self._solve_breakpoints(loads, alpha, beta, min_power, max_power, history)
+        elif method == "bisection":
+            lambdas = self._solve_bisection(loads, alpha, beta, min_power, max_power, history, tol, max_iter)
+        else:
+            raise ValueError("Unknown method {}".format(method))
+
+        powers = np.clip(alpha * lambdas[..., None] + beta, min_power, max_power)
+        self.lambda_value = lambdas
+        self.systemLoad = loads
+        self._cache_store(key, system, powers, lambdas)
+        return powers, lambdas
+
+    def _solve_breakpoints(self, loads, alpha, beta, min_power, max_power, history):
+        # The total output is piecewise linear and non decreasing in lambda,
+        # with a kink wherever a unit reaches one of its limits. Sorting
+        # those kinks gives the exact lambda of any load by interpolation.
+        lambda_lo = (min_power - beta) / alpha
+        lambda_hi = (max_power - beta) / alpha
+        points = np.concatenate([lambda_lo, lambda_hi])
+        steps = np.concatenate([alpha, -alpha])
+        finite = np.isfinite(points)
+        points, steps = points[finite], steps[finite]
+        slope_left = alpha[~np.isfinite(lambda_lo)].sum()
+        if len(points) == 0:
+            return (loads - beta.sum()) / slope_left
+
+        order = np.argsort(points, kind="stable")
+        points = points[order]
+        slopes = slope_left + np.cumsum(steps[order])
+        total = np.clip(alpha * points[0] + beta, min_power, max_power).sum()
+        totals = total + np.concatenate([[0], np.cumsum(slopes[:-1] * np.diff(points))])
+        if history:
+            self.history = {"lambda": points, "power": totals}
+
+        k = np.searchsorted(totals, loads, side="left")
+        inner = np.clip(k - 1, 0, len(points) - 1)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            lambdas = points[inner] + (loads - totals[inner]) / slopes[inner]
+            lambdas = np.minimum(lambdas, points[np.minimum(k, len(points) - 1)])
+            # Below the first or above the last kink
+            below = points[0] - (totals[0] - loads) / slope_left
+            above = points[-1] + (loads - totals[-1]) / slopes[-1]
+        below = below if slope_left > 0 else np.full(loads.shape, points[0])
+        above = above if slopes[-1] > 0 else np.full(loads.shape, points[-1])
+        lambdas = np.where(k == 0, below, lambdas)
+        lambdas = np.where(k == len(points), above, lambdas)
+        return lambdas
+
+    def _solve_bisection(self, loads, alpha, beta, min_power, max_power, history, tol, max_iter):
+        if not (np.all(np.isfinite(min_power)) and np.all(np.isfinite(max_power))):
+            raise ValueError("Bisection needs finite power limits, use the breakpoints method")
+        lambda_min = np.full(loads.shape, ((min_power - beta) / alpha).min())
+        lambda_max = np.full(loads.shape, ((max_power - beta) / alpha).max())
+        if history:
+            self.history = {"lambda": [], "err": []}
+        for i in range(max_iter):
+            lambdas = (lambda_min + lambda_max) / 2
+            eps = np.clip(alpha * lambdas[..., None] + beta, min_power, max_power).sum(axis=-1) - loads
+            if history:
+                self.history["lambda"].append(lambdas)
+                self.history["err"].append(eps)
+            lambda_max = np.where(eps > 0, lambdas, lambda_max)
+            lambda_min = np.where(eps < 0, lambdas, lambda_min)
+            if np.all(np.abs(eps) < tol) or np.all(lambda_max - lambda_min <= 1e-12 * np.abs(lambda_max)):
+                break
+        if history:
+            self.history = {k: np.array(v) for k, v in self.history.items()}
+        return lambdas
+
+
+class MultiPeriodDispatch(object):
+    # Economic dispatch of T periods coupled by the ramp limits of the units,
+    # for a given commitment (on, a [T, units] mask, all on by default):
+    #   min  sum on * fuel_cost * (a + b P + c P^2)
+    #   s.t. sum_u P[t, u] = load[t],  min_power * on <= P <= max_power * on
+    #        and the ramp rows of LPModel between consecutive periods
+    # The QP is solved by ADMM (OSQP iteration with Ruiz scaling and
+    # adaptive rho). The Hessian is diagonal and, with the variables unit
+    # major, the ramp rows make the x update matrix tridiagonal: it is
+    # factored as a banded Cholesky and the T balance rows are added with
+    # the Woodbury identity, so each iteration is O(T units).
+    def __init__(self, rho=.1, sigma=1e-6, alpha=1.6, eps=1e-5, max_iter=4000, scaling=10, check=25):
+        self.rho = rho
+        self.sigma = sigma
+        self.alpha = alpha
+        self.eps = eps
+        self.max_iter = max_iter
+        self.scaling = scaling
+        self.check = check
+        self.lambda_value = None
+        self.systemLoad = None
+        self.status = None
+        self.termination = None
+        self.iterations = 0
+        self.cost = None
+        self._warm = None
+
+    def _problem(self, fleet, load, on, initial_power):
+        # Unit major variables x[u * T + t] and the rows: bounds (identity),
+        # balance (T) and ramps (units x T - 1)
+        import scipy.sparse as sp
+        T, N = on.shape
+        on = on.T
+        lb = fleet.min_power[:, None] * on
+        ub = fleet.max_power[:, None] * on
+        start = on[:, 1:] & ~on[:, :-1]
+        stop = on[:, :-1] & ~on[:, 1:]
+        ramp_up = np.where(on[:, :-1], fleet.ramp_up[:, None], 0) + fleet.min_power[:, None] * start
+        ramp_down = np.where(on[:, 1:], fleet.ramp_down[:, None], 0) + fleet.min_power[:, None] * stop
+        if initial_power is not None:
+            # Ramp from the power before the first period, NaN if unknown
+            p0 = np.asarray(initial_power, dtype=float)
+            known = ~np.isnan(p0)
+            was_on = p0 > 0
+            up = np.where(was_on, fleet.ramp_up, 0) + fleet.min_power * (on[:, 0] & ~was_on)
+            down = np.where(on[:, 0], fleet.ramp_down, 0) + fleet.min_power * (was_on & ~on[:, 0])
+            lb[known, 0] = np.maximum(lb[known, 0], (p0 - down)[known])
+            ub[known, 0] = np.minimum(ub[known, 0], (p0 + up)[known])
+
+        diff = sp.diags([-np.ones(T - 1), np.ones(T - 1)], [0, 1], shape=(T - 1, T))
+        A = sp.vstack([sp.identity(N * T), sp.kron(np.ones((1, N)), sp.identity(T)),
+                       sp.kron(sp.identity(N), diff)], format='csr')
+        l = np.concatenate([lb.ravel(), load, -ramp_down.ravel()])
+        u = np.concatenate([ub.ravel(), load, ramp_up.ravel()])
+        fuel = fleet.fuel_cost[:, None] * on
+        P = (2 * fleet.curve[:, 2, None] * fuel).ravel()
+        q = (fleet.curve[:, 1, None] * fuel).ravel()
+        return P, q, A, l, u
+
+    def _equilibrate(self, P, A):
+        # Ruiz scaling of the KKT matrix: x = D xs, rows scaled by E
+        import scipy.sparse as sp
+        m, n = A.shape
+        D, E = np.ones(n), np.ones(m)
+        As, Ps = A, P
+        for _ in range(self.scaling):
+            col = np.maximum(np.abs(Ps), abs(As).max(axis=0).toarray().ravel())
+            row = abs(As).max(axis=1).toarray().ravel()
+            D /= np.sqrt(np.where(col > 1e-8, col, 1))
+            E /= np.sqrt(np.where(row > 1e-8, row, 1))
+            As = sp.diags(E) @ A @ sp.diags(D)
+            Ps = D * P * D
+        return D, E, As.tocsr(), Ps
+
+    def _factor(self, Ps, As, rho, T, N):
+        # Factors of M = P + sigma I + A' diag(rho) A
+        import scipy.sparse as sp
+        from scipy.linalg import cho_factor, cholesky_banded
+        n = N * T
+        bounds, balance, ramps = As[:n], As[n:n + T], As[n + T:]
+        K = (ramps.T @ sp.diags(rho[n + T:]) @ ramps).tocsr()
+        ab = np.zeros((2, n))
+        ab[1] = Ps + self.sigma + rho[:n] * bounds.diagonal() ** 2 + K.diagonal()
+        ab[0, 1:] = K.diagonal(1)
+        band = cholesky_banded(ab)
+        # Schur complement of the balance rows: diag(1 / rho) + W B^-1 W'.
+        # B = U'U is block diagonal over the units and W diagonal within each
+        # block: B^-1 W' is solved for chunks of units at once, one period
+        # per step of the bidiagonal substitutions.
+        coo = balance.tocoo()
+        w = np.zeros((N, T))
+        w[coo.col // T, coo.col % T] = coo.data
+        diag = band[1].reshape(N, T)
+        upper = band[0].reshape(N, T)
+        S = np.diag(1 / rho[n:n + T])
+        chunk = max(1, int(4e6 // (T * T)))
+        for u0 in range(0, N, chunk):
+            d, e, wc = diag[u0:u0 + chunk], upper[u0:u0 + chunk], w[u0:u0 + chunk]
+            # y[t, u, s]: row t of the block of unit u, column s
+            y = np.zeros((T,) + d.shape)
+            y[np.arange(T), :, np.arange(T)] = wc.T
+            y[0] /= d[:, :1]
+            for t in range(1, T):
+                y[t, :, :t + 1] = (y[t, :, :t + 1] - e[:, t, None] * y[t - 1, :, :t + 1]) / d[:, t, None]
+            y[T - 1] /= d[:, T - 1:]
+            for t in range(T - 2, -1, -1):
+                y[t] = (y[t] - e[:, t + 1, None] * y[t + 1]) / d[:, t, None]
+            S += np.einsum('ut,tus->ts', wc, y)
+        return band, balance, cho_factor(S)
+
+    @staticmethod
+    def _solve_kkt(factors, r):
+        from scipy.linalg import cho_solve, cho_solve_banded
+        band, balance, schur = factors
+        v = cho_solve_banded((band, False), r)
+        return v - cho_solve_banded((band, False), balance.T @ cho_solve(schur, balance @ v))
+
+    def _infeasible(self, A, l, u, dy):
+        # Primal infeasibility certificate of OSQP on the dual steps since
+        # the last check: A' dy ~ 0 and u' max(dy, 0) + l' min(dy, 0) < 0
+        norm = np.abs(dy).max()
+        if norm == 0:
+            return False
+        up, lo = dy > 1e-10 * norm, dy < -1e-10 * norm
+        if np.isinf(u[up]).any() or np.isinf(l[lo]).any():
+            return False
+        tol = 1e-4 * norm
+        return np.abs(A.T @ dy).max() <= tol and u[up] @ dy[up] + l[lo] @ dy[lo] < -tol
+
+    def solve(self, system, load, on=None, initial_power=None, warm_start=False):
+        # Returns the powers [T, units] and the system lambda [T]. With
+        # warm_start the previous solution of the same size is the start.
+        fleet = system.fleet
+        load = np.asarray(load, dtype=float)
+        T, N = len(load), len(fleet)
+        on = np.ones((T, N), dtype=bool) if on is None else np.asarray(on, dtype=bool)
+        P, q, A, l, u = self._problem(fleet, load, on, initial_power)
+        D, E, As, Ps = self._equilibrate(P, A)
+        qs = D * q
+        c = 1 / max(np.abs(Ps).mean(), np.abs(qs).max(), 1e-8)
+        Ps, qs = c * Ps, c * qs
+        ls, us = E * l, E * u
+        m, n = As.shape
+
+        # Equality rows get a larger rho, free rows the smallest one
+        eq = us - ls < 1e-8
+        free = np.isinf(ls) & np.isinf(us)
+        def rhos(rho):
+            r = np.full(m, rho)
+            r[eq] *= 1e3
+            r[free] = 1e-6
+            return r
+
+        rho = self.rho
+        rv = rhos(rho)
+        factors = self._factor(Ps, As, rv, T, N)
+        if warm_start and self._warm is not None and self._warm[0].shape == (n,) and self._warm[1].shape == (m,):
+            x, y = self._warm[0] / D, self._warm[1] / E * c
+        else:
+            x, y = np.zeros(n), np.zeros(m)
+        z = np.clip(As @ x, ls, us)
+        a = self.alpha
+        self.status = False
+        self.termination = 'max_iter'
+        for it in range(self.max_iter):
+            xt = self._solve_kkt(factors, self.sigma * x - qs + As.T @ (rv * z - y))
+            zt = As @ xt
+            x = a * xt + (1 - a) * x
+            zr = a * zt + (1 - a) * z
+            z_new = np.clip(zr + y / rv, ls, us)
+            y = y + rv * (zr - z_new)
+            z = z_new
+            if it % self.check:
+                continue
+            # Unscaled residuals and tolerances
+            Ax, Aty, Px = As @ x, As.T @ y, Ps * x
+            primal = np.abs((Ax - z) / E).max()
+            dual = np.abs((Px + qs + Aty) / D).max() / c
+            if primal <= self.eps * (1 + max(np.abs(Ax / E).max(), np.abs(z / E).max())) and \
+                    dual <= self.eps * (1 + max(np.abs(Px / D).max(), np.abs(Aty / D).max(), np.abs(qs / D).max()) / c):
+                self.status = True
+                self.termination = 'optimal'
+                break
+            if it and self._infeasible(As, ls, us, y - y_check):
+                self.termination = 'infeasible'
+                break
+            y_check = y
+            ratio = np.sqrt(np.abs(Ax - z).max() / max(np.abs(Ax).max(), np.abs(z).max(), 1e-10)
+                            / max(np.abs(Px + qs + Aty).max()
+                                  / max(np.abs(Px).max(), np.abs(Aty).max(), np.abs(qs).max(), 1e-10), 1e-10))
+            if ratio > 5 or ratio < .2:
+                rho = float(np.clip(rho * ratio, 1e-6, 1e6))
+                rv = rhos(rho)
+                factors = self._factor(Ps, As, rv, T, N)
+        self.iterations = it + 1
+        x, y = D * x, E * y / c
+        self._warm = (x, y)
+
+        powers = x.reshape(N, T).T
+        # Marginal cost of the balance rows
+        self.lambda_value = -y[n:n + T]
+        self.systemLoad = load
+        self.cost = (on * fleet.input_output(powers.T).T * fleet.fuel_cost).sum()
+        return powers, self.lambda_value
@@ -0,0 +1,277 @@
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import numpy as np
+
+from .economic_dispatch import LambdaIteration
+from .priority_list import CommitmentRepair
+from .report import RunReport, SolveStats
+
+# States of the unit dynamic program, each with a counter of hours: on (F),
+# on and shutting down next period (M), off (OFF), and on since before
+# the horizon (CF, CM) for the units with an initial state
+F, M, OFF, CF, CM = range(5)
+
+
+def _dispatch(fuel, b, c, lam, lo, hi):
+    # Power in [lo, hi] minimising fuel * (b p + c p^2) - lam p
+    with np.errstate(divide='ignore', invalid='ignore'):
+        vertex = np.where(c > 0, (lam / fuel - b) / (2 * c), np.where(fuel * b < lam, np.inf, -np.inf))
+    return np.clip(vertex, lo, np.maximum(lo, hi))
+
+
+def _cost(fuel, a, b, c, lam, mu, p, reserve):
+    # Lagrangian cost of a unit for one period
+    return fuel * (a + b * p + c * p * p) - lam * p - mu * reserve
+
+
+def _shift(V, kind, start, stay, valid):
+    # Value of one more hour in a counter chain, from counter k - 1 or
+    # staying at the last counter (stay), the first counter being reached
+    # from start = (value, code). Returns it with the code of the previous
+    # state, code = kind * S + counter.
+    n, S = V.shape
+    units = np.arange(n)
+    pred = np.full((n, S), np.inf)
+    ptr = np.full((n, S), -1, dtype=int)
+    pred[:, 1:] = V[:, :-1]
+    ptr[:, 1:] = kind * S + np.arange(S - 1)
+    pred[:, 0], ptr[:, 0] = start
+    value = V[units, stay]
+    better = value < pred[units, stay]
+    pred[units[better], stay[better]] = value[better]
+    ptr[units[better], stay[better]] = kind * S + stay[better]
+    pred[~valid] = np.inf
+    return pred, ptr
+
+
+def _dp_chunk(args):
+    # Dynamic program of a chunk of units for the multipliers lam (balance)
+    # and mu (reserve), the units at once with their counters padded to S.
+    # Start up cost, min up / down times and the start up / shut down ramps
+    # are exact; ramps between on periods only bound the power reachable
+    # since the last start up, so that the value is still a lower bound.
+    # Returns the on status, power and reserve [T, units] and the value of
+    # each unit.
+    (lam, mu, curve, fuel, min_power, max_power, ramp_up, ramp_down, start_up_cost,
+     min_uptime, min_rest, status, p0) = args
+    T, n = len(lam), len(fuel)
+    units = np.arange(n)
+    col = lambda x: x[:, None]
+    a, b, c = (curve[:, i] for i in range(3))
+    has_up, has_down = np.isfinite(ramp_up), np.isfinite(ramp_down)
+    # Counters: hours on (until reaching max power after a start up at min
+    # power, and at least the min up time), hours off and hours on since
+    # before the horizon
+    chain = np.where(has_up, np.ceil((max_power - min_power) / np.where(has_up, ramp_up, 1)) + 1, 1)
+    K = np.maximum(np.maximum(min_uptime, 1), chain).astype(int)
+    D = np.maximum(min_rest, 1).astype(int)
+    L = np.maximum(min_uptime, 1).astype(int)
+    S = int(max(K.max(), D.max(), L.max()))
+    hours = np.arange(S)
+    valid_on, valid_off, valid_cont = (hours < col(X) for X in (K, D, L))
+    can_stop_on = valid_on & (hours >= col(L) - 1)
+    can_stop_cont = valid_cont & (hours >= col(L) - 1)
+
+    # Power and reserve limits of the on states by hours since start up.
+    # Before a shut down the power is at most min power (shut down ramp)
+    # and so is the reserve (reserve ramp down).
+    ub = np.where(col(has_up), np.minimum(col(max_power), col(min_power) + hours * col(np.where(has_up, ramp_up, 0))),
+                  col(max_power))
+    ub_stop = np.where(col(has_down), col(min_power), ub)
+    reserve_stop = np.where(col(has_up), np.minimum(ub, col(min_power)), ub)
+
+    # Values before the first period. Units without an initial state are
+    # free of any history: on long enough to stop, or off long enough to
+    # start, with no ramp from a previous power.
+    known = status != 0
+    was_on = status > 0
+    free = ~known
+    V = np.full((5, n, S), np.inf)
+    off = known & ~was_on
+    V[OFF, units[off], np.minimum(-status[off], D[off]).astype(int) - 1] = 0
+    V[OFF, units[free], D[free] - 1] = 0
+    on_hours = np.where(was_on, np.minimum(status, L), L).astype(int) - 1
+    cont = was_on | free
+    V[CF, units[cont], on_hours[cont]] = 0
+    stop = was_on & (status >= min_uptime) & (~has_down | (p0 <= min_power))
+    V[CM, units[stop], on_hours[stop]] = 0
+
+    history = []
+    for t in range(T):
+        W = np.empty((5, n, S))
+        ptr = np.empty((5, n, S), dtype=int)
+
+        # On since a start up in the horizon, at min power the first hour
+        pred, ptr[F] = _shift(V[F], F, (V[OFF, units, D - 1] + start_up_cost, OFF * S + D - 1), K - 1, valid_on)
+        ptr[M] = ptr[F]
+        p_on = _dispatch(col(fuel), col(b), col(c), lam[t], col(min_power), ub)
+        p_stop = _dispatch(col(fuel), col(b), col(c), lam[t], col(min_power), ub_stop)
+        W[F] = pred + _cost(col(fuel), col(a), col(b), col(c), lam[t], mu[t], p_on, ub)
+        W[M] = pred + _cost(col(fuel), col(a), col(b), col(c), lam[t], mu[t], p_stop, reserve_stop)
+
+        # Off, after a shut down from either chain of on states
+        stops = np.concatenate([np.where(can_stop_on, V[M], np.inf), np.where(can_stop_cont, V[CM], np.inf)], axis=1)
+        best = stops.argmin(axis=1)
+        start = (stops[units, best], np.where(best < S, M * S + best, CM * S + best - S))
+        W[OFF], ptr[OFF] = _shift(V[OFF], OFF, start, D - 1, valid_off)
+
+        # On since before the horizon, ramping from the initial power first
+        lo, hi = min_power, max_power
+        if t == 0:
+            lo = np.where(was_on & has_down, np.maximum(min_power, p0 - ramp_down), min_power)
+            hi = np.where(was_on & has_up, np.minimum(max_power, p0 + ramp_up), max_power)
+        hi_stop = np.where(has_down, np.minimum(hi, min_power), hi)
+        reserve_cont_stop = np.where(has_up, np.minimum(hi, min_power), hi)
+        pred, ptr[CF] = _shift(V[CF], CF, (np.inf, -1), L - 1, valid_cont)
+        ptr[CM] = ptr[CF]
+        p_cont = _dispatch(fuel, b, c, lam[t], lo, hi)
+        p_cont_stop = _dispatch(fuel, b, c, lam[t], lo, hi_stop)
+        W[CF] = pred + col(np.where(lo <= hi, _cost(fuel, a, b, c, lam[t], mu[t], p_cont, hi), np.inf))
+        W[CM] = pred + col(np.where(lo <= hi_stop, _cost(fuel, a, b, c, lam[t], mu[t], p_cont_stop, reserve_cont_stop),
+                                    np.inf))
+        history.append((ptr, (p_on, p_stop, p_cont, p_cont_stop), (ub, reserve_stop, hi, reserve_cont_stop)))
+        V = W
+
+    # Backtrack from the best final state
+    flat = V.transpose(1, 0, 2).reshape(n, -1)
+    code = flat.argmin(axis=1)
+    value = flat[units, code]
+    on = np.zeros((T, n), dtype=bool)
+    power = np.zeros((T, n))
+    reserve = np.zeros((T, n))
+    for t in range(T - 1, -1, -1):
+        ptr, (p_on, p_stop, p_cont, p_cont_stop), (ub, reserve_stop, hi, reserve_cont_stop) = history[t]
+        kind, k = np.divmod(code, S)
+        is_state = [kind == F, kind == M, kind == CF, kind == CM]
+        on[t] = kind != OFF
+        power[t] = np.select(is_state, [p_on[units, k], p_stop[units, k], p_cont, p_cont_stop], 0)
+        reserve[t] = np.select(is_state, [ub[units, k], reserve_stop[units, k], hi, reserve_cont_stop], 0)
+        code = ptr[kind, units, k]
+    return on, power, reserve, value
+
+
+class LagrangianModel(CommitmentRepair):
+    # Unit commitment by Lagrangian relaxation of the balance and reserve
+    # constraints of LPModel. For given multipliers each unit is a dynamic
+    # program over its on / off states (see _dp_chunk), the units being
+    # split in chunks solved on a pool of threads (pool='thread') or
+    # processes (pool='process') of the given workers, serially by default.
+    # The multipliers follow a subgradient method with Polyak steps towards
+    # the best feasible cost. Each commitment found is repaired and
+    # dispatched by CommitmentRepair (units added by average full load
+    # cost until the capacity covers the load and the reserve, keeping min
+    # up / down times, and all the ramps enforced): its cost plus the start
+    # ups is an upper bound and the dual value a lower bound. The
+    # costs are the quadratic input-output curves, not their linearisation.
+    # start, an on status [T, units], is repaired first, e.g. the previous
+    # window of a rolling horizon.
+    def __init__(self, system, initial_state=None, workers=None, pool='thread', max_iter=100, tol=5e-3,
+                 patience=5, hooks=None):
+        super(LagrangianModel, self).__init__(system, initial_state, hooks)
+        self.workers = workers
+        self.pool = pool
+        self.max_iter = max_iter
+        self.tol = tol
+        self.patience = patience
+        self.lower_bound = None
+        self.upper_bound = None
+        self.gap = None
+        self.multipliers = None
+        self.history = []
+        self.start = None
+
+    def _chunks(self, lam, mu, status, p0):
+        fleet = self.system.fleet
+        for idx in np.array_split(np.arange(len(fleet)), self.workers or 1):
+            if len(idx):
+                yield (lam, mu, fleet.curve[idx], fleet.fuel_cost[idx], fleet.min_power[idx],
+                       fleet.max_power[idx], fleet.ramp_up[idx], fleet.ramp_down[idx], fleet.start_up_cost[idx],
+                       fleet.min_uptime[idx], fleet.min_rest[idx], status[idx], p0[idx])
+
+    def solve(self, load, reserve_req=None):
+        # Returns the status (gap within tol) and the best feasible cost
+        self.report = RunReport(self.hooks)
+        self.reserve_req = reserve_req
+        start_time = time.perf_counter()
+        load = np.asarray(load, dtype=float)
+        T = len(load)
+        r = self._reserve_req()
+        with_reserve = 1 > r > 0
+        required = load * (1 + r) if with_reserve else load
+        status, p0 = self._initial_arrays()
+
+        _, lam = LambdaIteration().solve_batch(self.system, load)
+        lam = np.maximum(lam, 0)
+        mu = np.zeros(T)
+        best_lb, best_ub = -np.inf, np.inf
+        theta, stall = 1., 0
+        tried = set()
+        self.history = []
+        self.on = self.power = None
+
+        def candidate(on):
+            # Repair a commitment not tried yet, returns its cost
+            key = on.tobytes()
+            if key in tried:
+                return np.inf
+            tried.add(key)
+            repaired = self._repair(on, load, required, status, p0)
+            if repaired is None:
+                return np.inf
+            ub = repaired[2] + self._start_up_cost(repaired[0], status)
+            if ub < best_ub:
+                self.on, self.power = repaired[:2]
+            return ub
+
+        if self.start is not None:
+            best_ub = min(best_ub, candidate(np.asarray(self.start) > .5))
+        executor = None
+        if self.workers:
+            executor = (ProcessPoolExecutor if self.pool == 'process' else ThreadPoolExecutor)(self.workers)
+        try:
+            for it in range(self.max_iter):
+                args = list(self._chunks(lam, mu, status, p0))
+                chunks = list(executor.map(_dp_chunk, args) if executor else map(_dp_chunk, args))
+                on = np.hstack([c[0] for c in chunks])
+                power = np.hstack([c[1] for c in chunks])
+                reserve = np.hstack([c[2] for c in chunks])
+                lb = sum(c[3].sum() for c in chunks) + lam @ load + (mu @ required if with_reserve else 0)
+                if lb > best_lb + 1e-9 * abs(lb):
+                    best_lb, stall = lb, 0
+                else:
+                    stall += 1
+                    if stall >= self.patience:
+                        theta, stall = theta / 2, 0
+
+                best_ub = min(best_ub, candidate(on))
+                gap = (best_ub - best_lb) / abs(best_ub) if np.isfinite(best_ub) else np.inf
+                self.history.append({'iteration': it, 'lower_bound': lb, 'upper_bound': best_ub, 'gap': gap,
+                                     'step': theta})
+                if gap <= self.tol:
+                    break
+
+                # Subgradients of the relaxed constraints, multipliers >= 0
+                g_lam = load - power.sum(axis=1)
+                g_mu = required - reserve.sum(axis=1) if with_reserve else np.zeros(T)
+                norm = g_lam @ g_lam + g_mu @ g_mu
+                if norm == 0 or theta < 1e-6:
+                    break
+                target = best_ub if np.isfinite(best_ub) else lb + .05 * abs(lb)
+                step = theta * (target - lb) / norm
+                lam = np.maximum(lam + step * g_lam, 0)
+                mu = np.maximum(mu + step * g_mu, 0)
+        finally:
+            if executor is not None:
+                executor.shutdown()
+
+        self.multipliers = (lam, mu)
+        self.lower_bound, self.upper_bound = best_lb, best_ub
+        self.gap = gap
+        self.cost = float(best_ub) if self.on is not None else None
+        status = bool(gap <= self.tol)
+        termination = 'optimal' if status else ('infeasible' if self.on is None else 'max_iter')
+        self.report.solved(SolveStats('lagrangian', time.perf_counter() - start_time, None, str(status), termination,
+                                      best_ub if self.on is not None else None, gap if np.isfinite(gap) else None,
+                                      it + 1))
+        return status, (float(best_ub) if self.on is not None else None)
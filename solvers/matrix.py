@@ -0,0 +1,412 @@
+import time
+
+import numpy as np
+import scipy.sparse as sp
+
+from .report import RunReport, scipy_stats
+from .results import Results
+
+
+class MatrixProblem(object):
+    # Mixed integer linear problem in matrix form:
+    #   min c x  s.t.  row_lb <= A x <= row_ub,  lb <= x <= ub
+    # Variables and rows are allocated in named blocks, so that the
+    # solution can be read back on the (t, unit) or (t, bus) grids.
+    def __init__(self):
+        self.num_vars = 0
+        self.num_rows = 0
+        self.vars = {}
+        self.rows = {}
+        self._lb, self._ub, self._integer, self._cost = [], [], [], []
+        self._A_rows, self._A_cols, self._A_vals = [], [], []
+        self._row_lb, self._row_ub = [], []
+
+    def add_vars(self, name, shape, lb=0, ub=np.inf, integer=False, cost=0):
+        n = int(np.prod(shape))
+        self.vars[name] = self.num_vars + np.arange(n).reshape(shape)
+        self._lb.append(np.broadcast_to(np.asarray(lb, dtype=float), shape).ravel())
+        self._ub.append(np.broadcast_to(np.asarray(ub, dtype=float), shape).ravel())
+        self._integer.append(np.full(n, int(integer)))
+        self._cost.append(np.broadcast_to(np.asarray(cost, dtype=float), shape).ravel())
+        self.num_vars += n
+        return self.vars[name]
+
+    def add_rows(self, name, terms, lb=-np.inf, ub=np.inf, mask=None):
+        # terms is a list of (columns, coefficients) pairs broadcasting to a
+        # common shape, one row per element of that shape (where mask holds)
+        shape = np.broadcast(*[np.empty(np.shape(cols)) for cols, _ in terms]).shape
+        keep = np.ones(shape, dtype=bool) if mask is None else np.broadcast_to(mask, shape)
+        n = int(keep.sum())
+        rows = np.full(shape, -1)
+        rows[keep] = self.num_rows + np.arange(n)
+        for cols, coef in terms:
+            cols = np.broadcast_to(cols, shape)[keep]
+            coef = np.broadcast_to(np.asarray(coef, dtype=float), shape)[keep]
+            nz = coef != 0
+            self._A_rows.append(rows[keep][nz])
+            self._A_cols.append(cols[nz])
+            self._A_vals.append(coef[nz])
+        self._row_lb.append(np.broadcast_to(np.asarray(lb, dtype=float), shape)[keep])
+        self._row_ub.append(np.broadcast_to(np.asarray(ub, dtype=float), shape)[keep])
+        self.rows[name] = rows
+        self.num_rows += n
+        return rows
+
+    def add_matrix_rows(self, name, M, cols, lb=-np.inf, ub=np.inf, shape=None):
+        # Rows M @ x[cols], for a sparse M with one column per entry of cols
+        M = sp.coo_matrix(M)
+        cols = np.asarray(cols).ravel()
+        n = M.shape[0]
+        rows = self.num_rows + np.arange(n)
+        self._A_rows.append(rows[M.row])
+        self._A_cols.append(cols[M.col])
+        self._A_vals.append(M.data.astype(float))
+        self._row_lb.append(np.broadcast_to(np.asarray(lb, dtype=float), (n,)).ravel())
+        self._row_ub.append(np.broadcast_to(np.asarray(ub, dtype=float), (n,)).ravel())
+        self.rows[name] = rows if shape is None else rows.reshape(shape)
+        self.num_rows += n
+        return self.rows[name]
+
+    def matrices(self):
+        # Returns c, A (CSR), row bounds, variable bounds and integrality
+        cat = lambda x, dtype=float: np.concatenate(x) if x else np.zeros(0, dtype=dtype)
+        A = sp.coo_matrix((cat(self._A_vals), (cat(self._A_rows, int), cat(self._A_cols, int))),
+                          shape=(self.num_rows, self.num_vars)).tocsr()
+        return (cat(self._cost), A, cat(self._row_lb), cat(self._row_ub),
+                cat(self._lb), cat(self._ub), cat(self._integer, int))
+
+
+def _shift(index, d):
+    # Columns of index[t - d], clipped at t = 0 (the caller masks those out)
+    return index[np.maximum(np.arange(index.shape[0]) - d, 0)]
+
+
+class MatrixLPModel(object):
+    # Same unit commitment formulation as LPModel, assembled directly as
+    # sparse matrices over the (t, unit) grid and solved in process with
+    # HiGHS through scipy.
+    def __init__(self, system, initial_state=None, hooks=None):
+        self.problem = None
+        self.system = system
+        self.initial_state = initial_state
+        self.x = None
+        self.res = None
+        self.hooks = hooks
+        self.report = RunReport(hooks)
+
+    def _size(self):
+        if self.problem is None:
+            return 0, 0
+        return self.problem.num_vars, self.problem.num_rows
+
+    def _phase(self, name):
+        return self.report.phase(name, self._size)
+
+    def _initial_arrays(self):
+        # Per unit arrays of the initial state: known, on, hours, power
+        names = self.system.fleet.names
+        states = [(self.initial_state or {}).get(u) for u in names]
+        known = np.array([s is not None for s in states])
+        status = np.array([0 if s is None else s[0] for s in states], dtype=float)
+        power = np.array([0 if s is None or s[0] <= 0 else s[1] for s in states], dtype=float)
+        return known, (status > 0).astype(float), status, power
+
+    def _build_units_equations(self, T):
+        pb = self.problem
+        fleet = self.system.fleet
+        U = len(fleet)
+        t = np.arange(T)[:, None]
+        # Hours left to serve from the initial state fix the commitment
+        known, on0, status, power0 = self._initial_arrays()
+        left_up = np.where(known & (status > 0), fleet.min_uptime - status, 0)
+        left_down = np.where(known & (status < 0), fleet.min_rest + status, 0)
+        on_lb = (t < left_up).astype(float)
+        on_ub = np.where(t < left_down, 0., 1.)
+
+        P  = pb.add_vars('varPower', (T, U))
+        su = pb.add_vars('binStartUp', (T, U), ub=1, integer=True)
+        sd = pb.add_vars('binShutDown', (T, U), ub=1, integer=True)
+        on = pb.add_vars('binIsOn', (T, U), lb=on_lb, ub=on_ub, integer=True)
+        pb.add_vars('varFuelCons', (T, U))
+        first = (t == 0) & known
+
+        # Startup Equations
+        pb.add_rows('eq_startup', [(on, 1), (_shift(on, 1), -1), (su, -1), (sd, 1)],
+                    lb=0, ub=0, mask=t > 0)
+        pb.add_rows('eq_startup_initial', [(on, 1), (su, -1), (sd, 1)], lb=on0, ub=on0, mask=first)
+
+        # Sliding windows: starts in the last min_uptime periods <= on[t],
+        # stops in the last min_rest periods <= 1 - on[t]
+        for name, window, switch, sign in (('eq_min_uptime', fleet.min_uptime, su, -1),
+                                           ('eq_min_rest', fleet.min_rest, sd, 1)):
+            terms = [(on, sign)] + [(_shift(switch, d), (d < window) & (t - d >= 0))
+                                    for d in range(window.max(initial=0))]
+            pb.add_rows(name, terms, ub=max(sign, 0), mask=window > 0)
+
+        # Ramp Equations
+        ramp_up, ramp_down = fleet.ramp_up, fleet.ramp_down
+        has_up, has_down = np.isfinite(ramp_up), np.isfinite(ramp_down)
+        ramp_up, ramp_down = np.where(has_up, ramp_up, 0), np.where(has_down, ramp_down, 0)
+        pb.add_rows('eq_ramp_up', [(P, 1), (_shift(P, 1), -1), (_shift(on, 1), -ramp_up),
+                                   (su, -fleet.min_power)], ub=0, mask=(t > 0) & has_up)
+        pb.add_rows('eq_ramp_down', [(_shift(P, 1), 1), (P, -1), (on, -ramp_down),
+                                     (sd, -fleet.min_power)], ub=0, mask=(t > 0) & has_down)
+        pb.add_rows('eq_ramp_up_initial', [(P, 1), (su, -fleet.min_power)],
+                    ub=power0 + ramp_up * on0, mask=first & has_up)
+        pb.add_rows('eq_ramp_down_initial', [(P, -1), (on, -ramp_down), (sd, -fleet.min_power)],
+                    ub=-power0, mask=first & has_down)
+
+        # Min Max Power
+        pb.add_rows('eq_min_power', [(P, 1), (on, -fleet.min_power)], lb=0)
+        pb.add_rows('eq_max_power', [(P, 1), (on, -fleet.max_power)], ub=0)
+
+    def _build_reserve_equations(self, T):
+        pb = self.problem
+        fleet = self.system.fleet
+        if self.system.reserve_req == 0:
+            return
+        U = len(fleet)
+        t = np.arange(T)[:, None]
+        P, su, sd, on = (pb.vars[k] for k in ('varPower', 'binStartUp', 'binShutDown', 'binIsOn'))
+        R = pb.add_vars('varReserve', (T, U))
+        has_up = np.isfinite(fleet.ramp_up)
+        pb.add_rows('eq_reserve_power', [(R, 1), (P, -1)], lb=0)
+        pb.add_rows('eq_reserve_max_power', [(R, 1), (on, -fleet.max_power)], ub=0)
+        ramp_up = np.where(has_up, fleet.ramp_up, 0)
+        pb.add_rows('eq_reserve_ramp_up', [(R, 1), (_shift(P, 1), -1), (_shift(on, 1), -ramp_up),
+                                           (su, -fleet.min_power)], ub=0, mask=(t > 0) & has_up)
+        known, on0, _, power0 = self._initial_arrays()
+        pb.add_rows('eq_reserve_ramp_up_initial', [(R, 1), (su, -fleet.min_power)],
+                    ub=power0 + ramp_up * on0, mask=(t == 0) & known & has_up)
+        sd_next = sd[np.minimum(np.arange(T) + 1, T - 1)]
+        pb.add_rows('eq_reserve_ramp_down', [(R, 1), (sd_next, fleet.max_power - fleet.min_power), (on, -fleet.max_power)],
+                    ub=0, mask=(t < T - 1) & has_up)
+
+    def _build_balance_equations(self, load):
+        pb = self.problem
+        load = np.asarray(load, dtype=float)
+        self._add_system_balance('eq_balance_power', pb.vars['varPower'], load)
+        r = self.system.reserve_req
+        if 1 > r > 0:
+            self._add_system_balance('eq_balance_reserve', pb.vars['varReserve'], load * (1 + r))
+
+    def _add_system_balance(self, name, var, rhs):
+        # sum over units of var[t, :] >= rhs[t]
+        T, U = var.shape
+        self.problem.add_matrix_rows(name, sp.kron(sp.identity(T), np.ones((1, U))), var, lb=rhs)
+
+    def _build_linear_objective(self, num_lines=2):
+        pb = self.problem
+        fleet = self.system.fleet
+        P, su, on, F = (pb.vars[k] for k in ('varPower', 'binStartUp', 'binIsOn', 'varFuelCons'))
+        # Support lines, identical for every time step
+        intercept, slope = fleet.support_lines(num_lines)
+        for i in range(num_lines):
+            pb.add_rows('support_lines_{}'.format(i), [(F, 1), (on, -intercept[:, i]), (P, -slope[:, i])], lb=0)
+        cost = np.zeros(pb.num_vars)
+        cost[F] = fleet.fuel_cost
+        cost[su] = fleet.start_up_cost
+        pb._cost = [cost]
+
+    def _build_model(self, load):
+        self.problem = MatrixProblem()
+        T = len(load)
+        with self._phase('units_equations'):
+            self._build_units_equations(T)
+        with self._phase('reserve_equations'):
+            self._build_reserve_equations(T)
+        with self._phase('balance_equations'):
+            self._build_balance_equations(load)
+        with self._phase('linear_objective'):
+            self._build_linear_objective()
+
+    def solve(self, load, tee=0, gap=0.01, time_limit=200):
+        self.report = RunReport(self.hooks)
+        self._build_model(load)
+        return self._solve_problem(tee, gap, time_limit)
+
+    def _solve_problem(self, tee=0, gap=0.01, time_limit=200):
+        from scipy.optimize import Bounds, LinearConstraint, milp
+        c, A, row_lb, row_ub, lb, ub, integrality = self.problem.matrices()
+        start = time.perf_counter()
+        self.res = milp(c, integrality=integrality, bounds=Bounds(lb, ub),
+                        constraints=LinearConstraint(A, row_lb, row_ub),
+                        options={'disp': bool(tee), 'mip_rel_gap': gap, 'time_limit': time_limit})
+        self.report.solved(scipy_stats('highs', self.res, time.perf_counter() - start))
+        status = self.res.status == 0
+        self.x = self.res.x if status else None
+        val = self.res.fun if status else None
+        return status, val
+
+    def _values(self, name):
+        return self.x[self.problem.vars[name]]
+
+    def get_results(self, fields=None):
+        # Results with the given fields, by default all of them
+        results = Results(self._values('varPower').shape[0])
+        for name in fields or self._result_fields():
+            getattr(self, '_add_' + name)(results)
+        return results
+
+    def _result_fields(self):
+        return ['power', 'status']
+
+    def _add_power(self, results):
+        results.add('power', self._values('varPower'), self.system.fleet.names, 'Unit', 'Power')
+
+    def _add_status(self, results):
+        results.add('status', self._values('binIsOn'), self.system.fleet.names, 'Unit', 'IsOn')
+
+    def get_power(self):
+        return self.get_results(['power']).long('power', categorical=False)
+
+
+class MatrixDCModel(MatrixLPModel):
+    # Matrix counterpart of DCModel, with the same formulations
+    def __init__(self, network, formulation='angle', monitored=None, initial_state=None, hooks=None):
+        super(MatrixDCModel, self).__init__(system=network.system, initial_state=initial_state, hooks=hooks)
+        if formulation not in ('angle', 'ptdf'):
+            raise ValueError("Unknown formulation {}".format(formulation))
+        self.network = network
+        self.formulation = formulation
+        self.monitored = monitored
+        self.demand = None
+        self.duals = None
+
+    def _bus_load(self, load, T):
+        return np.array([load[b] if b in load else np.zeros(T) for b in self.network.buses],
+                        dtype=float).T
+
+    def _monitored(self):
+        arcs = list(self.network.lines)
+        return [arcs.index(arc) for arc in self.network.monitored(self.monitored)]
+
+    def _links(self):
+        names = self.system.fleet.names
+        return np.array([[self.network.link(bus, u) for u in names] for bus in self.network.buses], dtype=float)
+
+    def _build_balance_equations(self, load):
+        pb = self.problem
+        T = pb.vars['varPower'].shape[0]
+        self.demand = self._bus_load(load, T)
+        if self.formulation == 'angle':
+            self._build_angle_equations()
+        else:
+            self._build_ptdf_equations()
+
+        r = self.system.reserve_req
+        if 1 > r > 0:
+            for k in range(len(self.network.buses)):
+                self._add_system_balance('eq_flow_reserve_{}'.format(k), pb.vars['varReserve'],
+                                         self.demand[:, k] * (1 + r))
+
+    def _build_angle_equations(self):
+        pb = self.problem
+        network = self.network
+        T, B = self.demand.shape
+        theta_lb = np.full((T, B), -np.inf)
+        theta_ub = np.full((T, B), np.inf)
+        theta_lb[:, 0] = theta_ub[:, 0] = 0
+        theta = pb.add_vars('varAngle', (T, B), lb=theta_lb, ub=theta_ub)
+
+        # Flow limits on the lines
+        flow = sp.diags(network.susceptance()) @ network.incidence()
+        lim = np.array([np.inf if l.power_lim is None else l.power_lim for l in network.lines.values()])
+        limited = np.isfinite(lim)
+        pb.add_matrix_rows('eq_flow_limits', sp.kron(sp.identity(T), flow[limited]), theta,
+                           lb=np.tile(-lim[limited], T), ub=np.tile(lim[limited], T), shape=(T, -1))
+
+        # Nodal balance: links @ power[t] - bbus @ theta[t] == demand[t]
+        block = sp.hstack([sp.csr_matrix(self._links()), -network.bbus()])
+        cols = np.concatenate([pb.vars['varPower'], theta], axis=1)
+        pb.add_matrix_rows('eq_flow_balance', sp.kron(sp.identity(T), block), cols,
+                           lb=self.demand.ravel(), ub=self.demand.ravel(), shape=(T, B))
+
+    def _build_ptdf_equations(self):
+        pb = self.problem
+        network = self.network
+        power = pb.vars['varPower']
+        T, U = power.shape
+        rows = self._monitored()
+        ptdf = network.ptdf()[rows]
+        shift = ptdf @ self._links()
+        shift[np.abs(shift) < 1e-10] = 0
+        base_flow = self.demand @ ptdf.T
+        lim = np.array([list(network.lines.values())[l].power_lim for l in rows], dtype=float)
+
+        total = self.demand.sum(axis=1)
+        pb.add_matrix_rows('eq_flow_balance', sp.kron(sp.identity(T), np.ones((1, U))), power,
+                           lb=total, ub=total)
+        pb.add_matrix_rows('eq_flow_limits', sp.kron(sp.identity(T), sp.csr_matrix(shift)), power,
+                           lb=(base_flow - lim).ravel(), ub=(base_flow + lim).ravel(), shape=(T, len(rows)))
+
+    def _build_model(self, load):
+        self.problem = MatrixProblem()
+        T = len(list(load.values())[0])
+        with self._phase('units_equations'):
+            self._build_units_equations(T)
+        with self._phase('reserve_equations'):
+            self._build_reserve_equations(T)
+        with self._phase('balance_equations'):
+            self._build_balance_equations(load)
+        with self._phase('linear_objective'):
+            self._build_linear_objective()
+
+    def _solve_problem(self, tee=0, gap=0.01, time_limit=200):
+        status, val = super()._solve_problem(tee, gap, time_limit)
+        if status:
+            self.duals = self._fixed_duals()
+        return status, val
+
+    def _fixed_duals(self):
+        # Duals of the LP with the commitment fixed to the MILP solution
+        from scipy.optimize import linprog
+        c, A, row_lb, row_ub, lb, ub, integrality = self.problem.matrices()
+        fixed = integrality == 1
+        lb, ub = lb.copy(), ub.copy()
+        lb[fixed] = ub[fixed] = np.round(self.x[fixed])
+        eq = row_lb == row_ub
+        up = ~eq & np.isfinite(row_ub)
+        lo = ~eq & np.isfinite(row_lb)
+        start = time.perf_counter()
+        res = linprog(c, A_ub=sp.vstack([A[up], -A[lo]]), b_ub=np.concatenate([row_ub[up], -row_lb[lo]]),
+                      A_eq=A[eq], b_eq=row_lb[eq], bounds=np.stack([lb, ub], axis=1), method='highs')
+        self.report.solved(scipy_stats('highs_fixed_lp', res, time.perf_counter() - start))
+        duals = np.zeros(self.problem.num_rows)
+        if res.status == 0:
+            duals[eq] = res.eqlin.marginals
+            duals[up] += res.ineqlin.marginals[:up.sum()]
+            duals[lo] -= res.ineqlin.marginals[up.sum():]
+        return duals
+
+    def _result_fields(self):
+        fields = super()._result_fields() + ['lines_power']
+        if self.duals is not None:
+            fields.append('lmp')
+        return fields
+
+    def _add_lmp(self, results):
+        rows = self.problem.rows
+        if self.formulation == 'ptdf':
+            # lambda[t] + sum over monitored lines of ptdf[l, b] * mu[t, l]
+            ptdf = self.network.ptdf()[self._monitored()]
+            lmp = self.duals[rows['eq_flow_balance']][:, None] + self.duals[rows['eq_flow_limits']] @ ptdf
+        else:
+            lmp = self.duals[rows['eq_flow_balance']]
+        results.add('lmp', lmp, self.network.buses, 'Node', 'LMP')
+
+    def _add_lines_power(self, results):
+        network = self.network
+        if self.formulation == 'ptdf':
+            power = (self._values('varPower') @ self._links().T - self.demand) @ network.ptdf().T
+        else:
+            flow = sp.diags(network.susceptance()) @ network.incidence()
+            power = (flow @ self._values('varAngle').T).T
+        results.add('lines_power', power, list(network.lines), ('Node A', 'Node B'), 'Power')
+
+    # Same row order as DCModel: bus and line major
+    def get_lmp(self):
+        return self.get_results(['lmp']).long('lmp', order='item', categorical=False)
+
+    def get_lines_power(self):
+        return self.get_results(['lines_power']).long('lines_power', order='item', categorical=False)
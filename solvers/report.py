@@ -0,0 +1,127 @@
+import numbers
+import time
+from collections import namedtuple
+from contextlib import contextmanager
+
+
+# Build phase of a model: wall time and the variables and constraints it added
+Phase = namedtuple('Phase', ['name', 'time', 'variables', 'constraints'])
+
+# Solver call: wall time of the call (writing, solving and reading back),
+# time reported by the solver itself, relative MIP gap and B&B nodes when
+# the solver gives them
+SolveStats = namedtuple('SolveStats', ['solver', 'wall_time', 'solver_time', 'status', 'termination',
+                                       'objective', 'gap', 'nodes'])
+
+
+def _number(x):
+    # Solver results leave unknown fields undefined or infinite
+    if isinstance(x, numbers.Number) and abs(x) != float('inf'):
+        return float(x)
+    return None
+
+
+def _relative_gap(lower, upper):
+    if lower is None or upper is None:
+        return None
+    return abs(upper - lower) / max(abs(upper), 1e-10)
+
+
+def pyomo_stats(solver, res, wall_time):
+    # SolveStats of a Pyomo SolverResults
+    info = res.solver
+    solver_time = _number(getattr(info, 'wallclock_time', None))
+    if solver_time is None:
+        solver_time = _number(getattr(info, 'time', None))
+    if solver_time is None:
+        solver_time = _number(getattr(info, 'system_time', None))
+    lower = _number(res.problem.lower_bound)
+    upper = _number(res.problem.upper_bound)
+    nodes = _number(info.statistics.branch_and_bound.number_of_bounded_subproblems)
+    return SolveStats(solver, wall_time, solver_time, str(info.status), str(info.termination_condition),
+                      upper, _relative_gap(lower, upper), None if nodes is None else int(nodes))
+
+
+
+def appsi_stats(solver, res, wall_time):
+    # SolveStats of a Pyomo APPSI Results
+    upper = _number(res.best_feasible_objective)
+    lower = _number(res.best_objective_bound)
+    return SolveStats(solver, wall_time, _number(getattr(res, 'wallclock_time', None)),
+                      'ok' if upper is not None else 'warning', res.termination_condition.name,
+                      upper, _relative_gap(lower, upper), None)
+
+# Status codes of scipy.optimize.milp and linprog
+_SCIPY_TERMINATION = {0: 'optimal', 1: 'limit', 2: 'infeasible', 3: 'unbounded', 4: 'error'}
+
+
+def scipy_stats(solver, res, wall_time):
+    # SolveStats of a scipy.optimize.milp / linprog result
+    nodes = getattr(res, 'mip_node_count', None)
+    return SolveStats(solver, wall_time, None, res.message, _SCIPY_TERMINATION.get(res.status, 'error'),
+                      _number(res.fun),
+                      _number(getattr(res, 'mip_gap', None)), None if nodes is None else int(nodes))
+
+
+class RunReport(object):
+    # Timings of a model solve: the build phases in order, with the number
+    # of variables and constraints each added, and every solver call. The
+    # hooks are called as hook(report, record) with each Phase or SolveStats
+    # as soon as it is recorded, e.g. to log or export metrics.
+    def __init__(self, hooks=None):
+        self.phases = []
+        self.solves = []
+        self.hooks = list(hooks or [])
+
+    def _record(self, records, record):
+        records.append(record)
+        for hook in self.hooks:
+            hook(self, record)
+
+    @contextmanager
+    def phase(self, name, size):
+        # size() returns the current (variables, constraints) of the model
+        variables, constraints = size()
+        start = time.perf_counter()
+        yield
+        elapsed = time.perf_counter() - start
+        v, c = size()
+        self._record(self.phases, Phase(name, elapsed, v - variables, c - constraints))
+
+    def solved(self, stats):
+        self._record(self.solves, stats)
+
+    @property
+    def build_time(self):
+        return sum(p.time for p in self.phases)
+
+    @property
+    def solve_time(self):
+        return sum(s.wall_time for s in self.solves)
+
+    @property
+    def variables(self):
+        return sum(p.variables for p in self.phases)
+
+    @property
+    def constraints(self):
+        return sum(p.constraints for p in self.phases)
+
+    def to_dict(self):
+        return {'build_time': self.build_time, 'solve_time': self.solve_time,
+                'variables': self.variables, 'constraints': self.constraints,
+                'phases': [p._asdict() for p in self.phases],
+                'solves': [s._asdict() for s in self.solves]}
+
+    def summary(self):
+        lines = ["{:<28}{:>10}{:>12}{:>13}".format('phase', 'time [s]', 'variables', 'constraints')]
+        for p in self.phases:
+            lines.append("{:<28}{:>10.3f}{:>12}{:>13}".format(p.name, p.time, p.variables, p.constraints))
+        for s in self.solves:
+            lines.append("{:<28}{:>10.3f}  {} gap={} nodes={} solver time={}".format(
+                'solve ' + s.solver, s.wall_time, s.termination, s.gap, s.nodes, s.solver_time))
+        return "\n".join(lines)
+
+    def __repr__(self):
+        return "RunReport(build_time={:.3f}, solve_time={:.3f}, variables={}, constraints={})".format(
+            self.build_time, self.solve_time, self.variables, self.constraints)
@@ -0,0 +1,128 @@
+import numpy as np
+
+
+class Results(object):
+    # Solution of a model as arrays over (t, item), items being units, buses
+    # or lines. Each field keeps the labels of its items, the name of the
+    # label column(s) and of the value column, so that wide and long
+    # DataFrames can be built on request only. Times are numbered from
+    # start, e.g. the first period of a window in a longer simulation.
+    def __init__(self, T, start=0):
+        self.T = T
+        self.start = start
+        self.fields = {}
+
+    def add(self, name, values, labels, columns, value_name):
+        # columns is the name of the label column, or a tuple of names when
+        # the labels are tuples, e.g. ('Node A', 'Node B') for lines
+        values = np.asarray(values, dtype=float).reshape(self.T, len(labels))
+        self.fields[name] = (values, list(labels), columns, value_name)
+
+    def __getitem__(self, name):
+        return self.fields[name][0]
+
+    def __contains__(self, name):
+        return name in self.fields
+
+    def select(self, names=None):
+        # Results with the given fields only, by default all of them
+        results = Results(self.T, self.start)
+        for name in names or self.fields:
+            results.fields[name] = self.fields[name]
+        return results
+
+    def head(self, n, start=None):
+        # Results of the first n periods, numbered from start
+        results = Results(n, self.start if start is None else start)
+        for name, (values, labels, columns, value_name) in self.fields.items():
+            results.add(name, values[:n], labels, columns, value_name)
+        return results
+
+    def _label_columns(self, name):
+        _, labels, columns, _ = self.fields[name]
+        if isinstance(columns, tuple):
+            return {c: [label[i] for label in labels] for i, c in enumerate(columns)}
+        return {columns: labels}
+
+    def wide(self, name):
+        # One row per t and one column per item
+        import pandas as pd
+        values, labels, columns, _ = self.fields[name]
+        if isinstance(columns, tuple):
+            index = pd.MultiIndex.from_tuples(labels, names=list(columns))
+        else:
+            index = pd.Index(labels, name=columns)
+        return pd.DataFrame(values, index=pd.RangeIndex(self.start, self.start + self.T, name='Time'), columns=index)
+
+    def long(self, name, order='time', categorical=True):
+        # One row per (t, item), t major with order='time' or item major
+        # with order='item'. Labels are categorical columns unless
+        # categorical=False.
+        import pandas as pd
+        values, labels, _, value_name = self.fields[name]
+        T, K = values.shape
+        if order == 'time':
+            times, codes, data = np.repeat(np.arange(T), K), np.tile(np.arange(K), T), values.ravel()
+        elif order == 'item':
+            times, codes, data = np.tile(np.arange(T), K), np.repeat(np.arange(K), T), values.T.ravel()
+        else:
+            raise ValueError("Unknown order {}".format(order))
+        df = {'Time': self.start + times}
+        for column, items in self._label_columns(name).items():
+            if categorical:
+                categories = pd.unique(np.asarray(items))
+                position = {c: i for i, c in enumerate(categories)}
+                df[column] = pd.Categorical.from_codes(np.array([position[i] for i in items])[codes], categories)
+            else:
+                df[column] = np.asarray(items)[codes]
+        df[value_name] = data
+        return pd.DataFrame(df)
+
+    def to_arrow(self, name, order='time', scenario=None):
+        import pyarrow as pa
+        table = pa.Table.from_pandas(self.long(name, order), preserve_index=False)
+        if scenario is not None:
+            table = table.append_column('Scenario', pa.array(np.full(len(table), scenario, dtype=np.int32)))
+        return table
+
+
+class ResultsWriter(object):
+    # Streams the long view of one field of many Results to a Parquet file
+    # (or an Arrow IPC file for .arrow/.feather paths), one chunk per
+    # write, so that a batch of scenarios never builds a single DataFrame:
+    #
+    #   with ResultsWriter('power.parquet', 'power') as writer:
+    #       for k, load in enumerate(loads):
+    #           model.solve(load)
+    #           writer.write(model.get_results(), scenario=k)
+    def __init__(self, path, name, order='time', compression='snappy'):
+        self.path = path
+        self.name = name
+        self.order = order
+        self.compression = compression
+        self._writer = None
+
+    def write(self, results, scenario=None):
+        table = results.to_arrow(self.name, self.order, scenario)
+        if self._writer is None:
+            import pyarrow as pa
+            if self.path.endswith(('.arrow', '.feather')):
+                # IPC files only compress with lz4 or zstd
+                options = pa.ipc.IpcWriteOptions(
+                    compression=self.compression if self.compression in ('lz4', 'zstd') else None)
+                self._writer = pa.ipc.new_file(self.path, table.schema, options=options)
+            else:
+                import pyarrow.parquet as pq
+                self._writer = pq.ParquetWriter(self.path, table.schema, compression=self.compression)
+        self._writer.write_table(table)
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
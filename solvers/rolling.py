@@ -0,0 +1,154 @@
+import time
+
+import numpy as np
+
+from .results import Results, ResultsWriter
+from ..systems.thermal import UnitState
+
+
+def _slice(load, first, last):
+    # Periods [first, last) of a load series, or of each bus of a dict
+    if isinstance(load, dict):
+        return {b: np.asarray(v)[first:last] for b, v in load.items()}
+    return np.asarray(load)[first:last]
+
+
+def _length(load):
+    if isinstance(load, dict):
+        return len(next(iter(load.values())))
+    return len(load)
+
+
+def _was_on(fleet, state):
+    # On status before the first period, None for the units without state
+    state = state or {}
+    return [None if u not in state else UnitState(*state[u]).status > 0 for u in fleet.names]
+
+
+def carry_state(fleet, on, power, state=None):
+    # UnitState of each unit after the periods of on and power [T, units],
+    # given the state before them. A unit whose past is unknown and that
+    # never changed is taken as in its state long enough to change.
+    T = len(on)
+    last = on[-1]
+    changed = on != last
+    steady = ~changed.any(axis=0)
+    hours = np.where(steady, T, np.argmax(changed[::-1], axis=0))
+    carried = {}
+    for i, (u, before) in enumerate(zip(fleet.names, _was_on(fleet, state))):
+        h = int(hours[i])
+        if steady[i] and before is None:
+            h += int(fleet.min_uptime[i] if last[i] else fleet.min_rest[i])
+        elif steady[i] and before == last[i]:
+            h += abs(int(UnitState(*state[u]).status))
+        carried[u] = UnitState(h, float(power[-1, i])) if last[i] else UnitState(-h, 0.)
+    return carried
+
+
+def committed_cost(fleet, on, power, state=None):
+    # Fuel (quadratic curves) and start up cost of on and power [T, units]
+    before = np.array([on[0, i] if b is None else b for i, b in enumerate(_was_on(fleet, state))])
+    starts = on & ~np.vstack([before, on[:-1]])
+    fuel = fleet.fuel_cost * fleet.input_output(power.T).T
+    return (on * fuel).sum() + (starts * fleet.start_up_cost).sum()
+
+
+class RollingHorizon(object):
+    # Chronological simulation of a long load series (an array, or a dict of
+    # bus loads for the DC models) with a unit commitment model: LPModel,
+    # DCModel, MatrixLPModel, PriorityListModel or LagrangianModel. Each
+    # window solves step periods and a look-ahead, commits the first step
+    # periods and starts the next window from their last state (on status,
+    # hours in that state and power) through the model's initial_state.
+    # Models with a start attribute also start from the commitment of the
+    # previous window.
+    #
+    # The committed results are streamed to one file per field, output being
+    # a path with {} for the field name ('.parquet', or '.arrow'), so that
+    # memory does not grow with the horizon. Without output they are kept in
+    # self.results.
+    #
+    #   rolling = RollingHorizon(LagrangianModel(system), step=24, lookahead=12,
+    #                            output='year_{}.parquet')
+    #   status, cost = rolling.run(load)
+    def __init__(self, model, step=24, lookahead=24, fields=('power', 'status'), output=None):
+        if step < 1 or lookahead < 0:
+            raise ValueError("step must be positive and lookahead non negative")
+        self.model = model
+        self.step = step
+        self.lookahead = lookahead
+        self.fields = list(fields)
+        self.output = output
+        self.windows = []
+        self.results = None
+        self.state = None
+        self.cost = None
+
+    def run(self, load, **kwargs):
+        # kwargs are passed on to model.solve. Returns the status (every
+        # window solved) and the cost of the committed periods. The model is
+        # left with the state after the last committed period.
+        model = self.model
+        fleet = model.system.fleet
+        T = _length(load)
+        fields = list(dict.fromkeys(self.fields + ['power', 'status']))
+        writers = {}
+        if self.output is not None:
+            writers = {f: ResultsWriter(self.output.format(f), f) for f in self.fields}
+        kept = []
+        self.windows = []
+        self.cost = 0.
+        self.state = model.initial_state
+        status = True
+        start = None
+        try:
+            for first in range(0, T, self.step):
+                last = min(first + self.step + self.lookahead, T)
+                n = min(self.step, T - first)
+                model.initial_state = self.state
+                if hasattr(model, 'start'):
+                    model.start = start
+                if hasattr(model, 'start_power'):
+                    model.start_power = None
+                begin = time.perf_counter()
+                solved, _ = model.solve(_slice(load, first, last), **kwargs)
+                elapsed = time.perf_counter() - begin
+                if not solved:
+                    self.windows.append({'first': first, 'length': last - first, 'status': False,
+                                         'cost': None, 'time': elapsed})
+                    status = False
+                    break
+
+                results = model.get_results(fields)
+                on = results['status'] > .5
+                committed = results.head(n, start=first)
+                cost = committed_cost(fleet, on[:n], committed['power'], self.state)
+                self.cost += cost
+                self.windows.append({'first': first, 'length': last - first, 'status': True,
+                                     'cost': cost, 'time': elapsed})
+                for f, writer in writers.items():
+                    writer.write(committed)
+                if self.output is None:
+                    kept.append(committed)
+
+                self.state = carry_state(fleet, on[:n], committed['power'], self.state)
+                # Commitment of the look-ahead, held at its last value up to
+                # the length of the next window
+                start = None
+                if last > first + n:
+                    following = min(first + n + self.step + self.lookahead, T) - (first + n)
+                    start = on[n:]
+                    start = np.vstack([start, np.repeat(start[-1:], following - len(start), axis=0)])
+        finally:
+            for writer in writers.values():
+                writer.close()
+            model.initial_state = self.state
+            if hasattr(model, 'start'):
+                model.start = None
+
+        if kept:
+            self.results = Results(sum(r.T for r in kept))
+            for f in self.fields:
+                _, labels, columns, value_name = kept[0].fields[f]
+                self.results.add(f, np.vstack([r[f] for r in kept]), labels, columns, value_name)
+        return status, self.cost
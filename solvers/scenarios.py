@@ -0,0 +1,190 @@
+import multiprocessing
+import os
+import pickle
+import queue
+import time
+import traceback
+from collections import deque, namedtuple
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+
+
+ScenarioResult = namedtuple('ScenarioResult',
+                            ['index', 'status', 'cost', 'dispatch', 'lmp', 'error', 'elapsed'])
+
+# Model class of each solver name, imported in the workers on first use
+SOLVERS = {
+    'lp': ('.unit_commitment', 'LPModel'),
+    'dc': ('.unit_commitment', 'DCModel'),
+    'scdc': ('.unit_commitment', 'SCDCModel'),
+    'matrix_lp': ('.matrix', 'MatrixLPModel'),
+    'matrix_dc': ('.matrix', 'MatrixDCModel'),
+    'lambda': ('.economic_dispatch', 'LambdaIteration'),
+}
+
+# System or network of the worker process, sent once by the initializer,
+# and the queue the worker signals the scenarios it starts on
+_target = None
+_started = None
+
+
+def _init_worker(payload, started):
+    global _target, _started
+    _target = pickle.loads(payload)
+    _started = started
+
+
+def _solve_scenario(index, solver, load, model_options, solve_options):
+    import importlib
+    start = time.perf_counter()
+    _started.put(index)
+    try:
+        module, name = SOLVERS[solver]
+        cls = getattr(importlib.import_module(module, __package__), name)
+        if solver == 'lambda':
+            system = getattr(_target, 'system', _target)
+            model = cls(**model_options)
+            if np.ndim(load) == 0:
+                dispatch = model.solve(system, load, **solve_options)
+                lam = model.lambda_value
+            else:
+                dispatch, lam = model.solve_batch(system, load, **solve_options)
+            cost = (system.fleet.input_output(np.moveaxis(dispatch, -1, 0)).T * system.fleet.fuel_cost).sum()
+            return ScenarioResult(index, True, cost, dispatch, lam, None, time.perf_counter() - start)
+
+        model = cls(_target, **model_options)
+        status, cost = model.solve(load, **solve_options)
+        dispatch = lmp = None
+        if status:
+            power = model.get_power()
+            dispatch = power.Power.values.reshape(-1, power.Unit.nunique())
+            if hasattr(model, 'get_lmp'):
+                try:
+                    lmp = model.get_lmp()
+                    lmp = lmp.LMP.values.reshape(lmp.Node.nunique(), -1).T
+                except Exception:
+                    lmp = None
+        return ScenarioResult(index, status, cost, dispatch, lmp, None, time.perf_counter() - start)
+    except Exception:
+        return ScenarioResult(index, False, None, None, None, traceback.format_exc(),
+                              time.perf_counter() - start)
+
+
+class ScenarioRunner(object):
+    # Solves many load scenarios of one system (or network) across a pool of
+    # worker processes. The target is pickled once and handed to each
+    # worker at start up, at most max_in_flight scenarios are submitted at
+    # a time and results are yielded as they arrive. A scenario running for
+    # longer than timeout seconds from the time a worker picked it up, or
+    # killing its worker, is reported as failed without stopping the others.
+    def __init__(self, target, solver='lp', model_options=None, solve_options=None,
+                 max_workers=None, max_in_flight=None, timeout=None, mp_context=None):
+        if solver not in SOLVERS:
+            raise ValueError("Unknown solver {}".format(solver))
+        self.target = target
+        self.solver = solver
+        self.model_options = model_options or {}
+        self.solve_options = solve_options or {}
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.max_in_flight = max_in_flight or 2 * self.max_workers
+        self.timeout = timeout
+        self.mp_context = mp_context
+
+    def _start_pool(self):
+        # A new start queue per pool, the one of a killed pool may be left
+        # broken by a worker killed while writing to it
+        context = self.mp_context or multiprocessing.get_context()
+        self._started = context.Queue()
+        return ProcessPoolExecutor(self.max_workers, mp_context=self.mp_context,
+                                   initializer=_init_worker, initargs=(self._payload, self._started))
+
+    def _drain_started(self, pending, started, now):
+        # Start times of the scenarios the workers signalled, queued futures
+        # are not counted (Future.running is also true for the futures
+        # handed to the call queue, not yet picked up by a worker)
+        futures = {index: future for future, (index, _) in pending.items()}
+        while True:
+            try:
+                index = self._started.get_nowait()
+            except queue.Empty:
+                return
+            if index in futures:
+                started.setdefault(futures[index], now)
+
+    @staticmethod
+    def _kill_pool(pool):
+        if hasattr(pool, 'kill_workers'):
+            pool.kill_workers()
+        else:
+            for p in list((pool._processes or {}).values()):
+                p.kill()
+        pool.shutdown(wait=True, cancel_futures=True)
+
+    def run(self, loads):
+        self._payload = pickle.dumps(self.target)
+        pool = self._start_pool()
+        scenarios = iter(enumerate(loads))
+        # Scenarios in flight when a worker died are run again one at a time,
+        # so that the one killing its worker can be told apart
+        suspects = deque()
+        retry = deque()
+        pending = {}
+        started = {}
+        try:
+            while True:
+                while not pending and suspects:
+                    index, load = suspects.popleft()
+                    pending[pool.submit(_solve_scenario, index, self.solver, load,
+                                        self.model_options, self.solve_options)] = (index, load)
+                while not suspects and len(pending) < self.max_in_flight:
+                    index, load = retry.popleft() if retry else next(scenarios, (None, None))
+                    if index is None:
+                        break
+                    pending[pool.submit(_solve_scenario, index, self.solver, load,
+                                        self.model_options, self.solve_options)] = (index, load)
+                if not pending:
+                    return
+
+                done, _ = wait(pending, timeout=None if self.timeout is None else .05,
+                               return_when=FIRST_COMPLETED)
+                now = time.perf_counter()
+                broken = False
+                for future in done:
+                    try:
+                        result = future.result()
+                    except BrokenProcessPool:
+                        broken = True
+                        continue
+                    pending.pop(future)
+                    started.pop(future, None)
+                    yield result
+
+                self._drain_started(pending, started, now)
+                expired = []
+                for future in pending:
+                    if self.timeout is not None and now - started.get(future, now) > self.timeout:
+                        expired.append(future)
+                if not broken and not expired:
+                    continue
+
+                # Restart the pool: the failed scenarios are reported, the
+                # others are submitted again
+                self._kill_pool(pool)
+                for future in expired:
+                    index, _ = pending.pop(future)
+                    yield ScenarioResult(index, False, None, None, None, 'timeout', now - started[future])
+                if broken and len(pending) == 1 and not retry:
+                    (index, _), = pending.values()
+                    yield ScenarioResult(index, False, None, None, None, 'worker crashed', None)
+                else:
+                    (suspects if broken else retry).extend(pending.values())
+                pending.clear()
+                started.clear()
+                pool = self._start_pool()
+        finally:
+            if pending:
+                self._kill_pool(pool)
+            else:
+                pool.shutdown()
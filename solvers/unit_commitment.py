@@ -1,334 +1,816 @@
-from .economic_dispatch import QPModel
+from ..systems.reduction import NetworkReduction
+from ..systems.thermal import UnitState
+from .backends import get_backend
+from .report import RunReport
+from .results import Results
+import time
 import numpy as np
-import pandas as pd
 
-from pyomo.environ import *
+
+def _array(component, shape, values=None):
+    # Values of an indexed component in the order of its index, as an array
+    # of the given shape. Variables without a value are NaN.
+    if values is None:
+        values = (v.value for v in component.values())
+    return np.fromiter((np.nan if v is None else v for v in values), float,
+                       count=len(component)).reshape(shape)
+
 
 class BaseModel(object):
-    def __init__(self, system):
+    # With persistent=True the model is kept between solves: the load, fuel
+    # costs and reserve requirement are mutable parameters updated in place
+    # as long as the horizon, the reserve structure and the units are the same.
+    # initial_state maps unit names to their UnitState. Without it the first
+    # period is unconstrained by the past.
+    # Each solve leaves a RunReport in self.report with the build phases and
+    # solver calls, hooks are passed on to it.
+    # solver is a SolverBackend or a name for get_backend, by default HiGHS
+    # in process: LPModel(system, solver=AppsiBackend('highs', gap=1e-3, threads=4))
+    # With a ResultCache, a solve of inputs already solved is served from
+    # it without building the model, get_results then giving the cached
+    # results.
+    def __init__(self, system, persistent=False, initial_state=None, hooks=None, solver=None, cache=None):
+        self.solver = get_backend(solver)
+        self.cache = cache
+        self._cached = None
         self.m = None
         self.system=system
+        self.persistent = persistent
+        self.initial_state = initial_state
+        self.reserve_req = None
+        self._structure = None
+        self.hooks = hooks
+        self.report = RunReport(hooks)
+
+    def _cache_inputs(self):
+        # What a solution depends on besides the arguments of solve
+        return {'model': type(self).__name__, 'system': self.system, 'initial_state': self.initial_state,
+                'solver': self.solver}
+
+    def _cache_lookup(self, *args):
+        # Key of the solve of args and its (status, cost) when cached
+        self._cached = None
+        if self.cache is None:
+            return None, None
+        with self._phase('cache_lookup'):
+            key = self.cache.key(self._cache_inputs(), *args)
+            hit = self.cache.get(key)
+        if hit is None:
+            return key, None
+        status, cost, self._cached = hit
+        return key, (status, cost)
+
+    def _cache_store(self, key, status, cost):
+        if key is not None:
+            self.cache.put(key, status, cost, self.get_results() if status else Results(0))
+        return status, cost
+
+    def _size(self):
+        # Number of variables and constraints built so far
+        if self.m is None:
+            return 0, 0
+        import pyomo.environ as pyo
+        return (sum(len(c) for c in self.m.component_objects(pyo.Var, descend_into=True)),
+                sum(len(c) for c in self.m.component_objects(pyo.Constraint, descend_into=True)))
+
+    def _phase(self, name):
+        return self.report.phase(name, self._size)
+
+    def _initial(self, u):
+        state = (self.initial_state or {}).get(u)
+        return None if state is None else UnitState(*state)
+
+    def _previous(self, t, u):
+        # On status and power of unit u before period t, None if unknown
+        m = self.m
+        if t != m.t.first():
+            return m.binIsOn[t-1, u], m.varPower[t-1, u]
+        state = self._initial(u)
+        if state is None:
+            return None
+        return self._count(u) * int(state.status > 0), self._count(u) * (state.power if state.status > 0 else 0)
+
+    def _model_system(self):
+        # System of the units the model has variables for
+        return self.system
+
+    def _count(self, u):
+        # Number of identical units behind unit u of the model, whose
+        # binaries are then numbers of units and its powers totals
+        return 1
+
+    def _reserve_req(self):
+        return self.system.reserve_req if self.reserve_req is None else self.reserve_req
 
     def _build_units_equations(self):
+        import pyomo.environ as pyo
         m = self.m
-        system = self.system
-        m.units = Set(initialize=[u.name for u in system])
+        system = self._model_system()
+        m.units = pyo.Set(initialize=[u.name for u in system])
         
-        m.varPower    = Var(m.t, m.units, domain=NonNegativeReals)
-        m.binStartUp  = Var(m.t, m.units, domain=Binary, initialize=0)
-        m.binShutDown = Var(m.t, m.units, domain=Binary, initialize=0)
-        m.binIsOn     = Var(m.t, m.units, domain=Binary, initialize=0)
+        m.varPower    = pyo.Var(m.t, m.units, domain=pyo.NonNegativeReals)
+        m.binStartUp  = pyo.Var(m.t, m.units, domain=pyo.Binary, initialize=0)
+        m.binShutDown = pyo.Var(m.t, m.units, domain=pyo.Binary, initialize=0)
+        m.binIsOn     = pyo.Var(m.t, m.units, domain=pyo.Binary, initialize=0)
             
         # Startup Equations
         def eq_startup(m, t, u):
-            if t == m.t.first():
-                return Constraint.Skip
+            previous = self._previous(t, u)
+            if previous is None:
+                return pyo.Constraint.Skip
             else:
-                return m.binIsOn[t, u] - m.binIsOn[t-1, u] == m.binStartUp[t, u] - m.binShutDown[t, u]
-        m.eq_startup = Constraint(m.t, m.units, rule=eq_startup)
+                return m.binIsOn[t, u] - previous[0] == m.binStartUp[t, u] - m.binShutDown[t, u]
+        m.eq_startup = pyo.Constraint(m.t, m.units, rule=eq_startup)
+
+        # Min up / down times as sliding windows of start ups / shut downs,
+        # from the first period of the window ending at t of each unit
+        T = len(m.t)
+        fleet = system.fleet
+        hours = np.arange(T)
+        up_start = {u: np.maximum(0, hours - L + 1) for u, L in zip(fleet.names, fleet.min_uptime)}
+        rest_start = {u: np.maximum(0, hours - L + 1) for u, L in zip(fleet.names, fleet.min_rest)}
 
         def eq_min_uptime(m, t, u):
-            if system[u].min_uptime is None or t > system[u].min_uptime:
-                return Constraint.Skip
+            if not system[u].min_uptime:
+                return pyo.Constraint.Skip
             else:
-                return (m.binShutDown[t, u] <=
-                    1 - sum(m.binStartUp[tt, u] for tt in m.t
-                        if t - system[u].min_uptime <= tt <= t)    
-                )
-        m.eq_min_uptime = Constraint(m.t, m.units, rule=eq_min_uptime)
+                return sum(m.binStartUp[tt, u] for tt in range(up_start[u][t], t + 1)) <= m.binIsOn[t, u]
+        m.eq_min_uptime = pyo.Constraint(m.t, m.units, rule=eq_min_uptime)
 
         def eq_min_rest(m, t, u):
-            if system[u].min_rest is None or t > system[u].min_rest:
-                return Constraint.Skip
+            if not system[u].min_rest:
+                return pyo.Constraint.Skip
             else:
-                return (m.binStartUp[t, u] <=
-                    1 - sum(m.binShutDown[tt, u] for tt in m.t
-                        if t - system[u].min_rest <= tt <= t)    
-                )
-        m.eq_min_rest = Constraint(m.t, m.units, rule=eq_min_rest)
+                return sum(m.binShutDown[tt, u] for tt in range(rest_start[u][t], t + 1)) <= self._count(u) - m.binIsOn[t, u]
+        m.eq_min_rest = pyo.Constraint(m.t, m.units, rule=eq_min_rest)
+
+        # Hours left to serve from the initial state
+        for u in m.units:
+            state = self._initial(u)
+            if state is None:
+                continue
+            if state.status > 0:
+                left, on = (system[u].min_uptime or 0) - state.status, 1
+            else:
+                left, on = (system[u].min_rest or 0) + state.status, 0
+            for t in range(min(max(left, 0), T)):
+                m.binIsOn[t, u].fix(on * self._count(u))
             
         # Ramp Equations
         def eq_ramp_up(m, t, u):
-            if  system[u].ramp_up is None or t == m.t.first():
-                return Constraint.Skip
+            previous = self._previous(t, u)
+            if  system[u].ramp_up is None or previous is None:
+                return pyo.Constraint.Skip
             else:
-                return m.varPower[t, u] - m.varPower[t-1, u] <= system[u].ramp_up * m.binIsOn[t-1,u] + system[u].min_power * m.binStartUp[t,u]
+                return m.varPower[t, u] - previous[1] <= system[u].ramp_up * previous[0] + system[u].min_power * m.binStartUp[t,u]
         
         def eq_ramp_down(m, t, u):
-            if  system[u].ramp_down is None or t == m.t.first():
-                return Constraint.Skip
+            previous = self._previous(t, u)
+            if  system[u].ramp_down is None or previous is None:
+                return pyo.Constraint.Skip
             else:
-                return m.varPower[t-1, u] - m.varPower[t, u] <= system[u].ramp_down * m.binIsOn[t,u] + system[u].min_power * m.binShutDown[t,u]
-        m.eq_ramp_up = Constraint(m.t, m.units, rule=eq_ramp_up)
-        m.eq_ramp_down = Constraint(m.t, m.units, rule=eq_ramp_down)
+                return previous[1] - m.varPower[t, u] <= system[u].ramp_down * m.binIsOn[t,u] + system[u].min_power * m.binShutDown[t,u]
+        m.eq_ramp_up = pyo.Constraint(m.t, m.units, rule=eq_ramp_up)
+        m.eq_ramp_down = pyo.Constraint(m.t, m.units, rule=eq_ramp_down)
 
         # Min Max Power
         def eq_min_power(m, t, u):
             return m.varPower[t, u] >= system[u].min_power * m.binIsOn[t, u]
         def eq_max_power(m, t, u):
             return m.varPower[t, u] <= system[u].max_power * m.binIsOn[t, u]
-        m.eq_min_power = Constraint(m.t, m.units, rule=eq_min_power)
-        m.eq_max_power = Constraint(m.t, m.units, rule=eq_max_power)
+        m.eq_min_power = pyo.Constraint(m.t, m.units, rule=eq_min_power)
+        m.eq_max_power = pyo.Constraint(m.t, m.units, rule=eq_max_power)
 
     # Reserves
     def _build_reserve_equations(self):
+        import pyomo.environ as pyo
         m = self.m
-        system = self.system
-        r = system.reserve_req
+        system = self._model_system()
+        r = self._reserve_req()
         if r == 0:
             return
-        m.varReserve = Var(m.t, m.units, domain=NonNegativeReals)
+        m.paramReserveReq = pyo.Param(mutable=True, initialize=r)
+        m.varReserve = pyo.Var(m.t, m.units, domain=pyo.NonNegativeReals)
         # Reserve > Power
-        m.eq_reserve_power = Constraint(m.t, m.units, 
+        m.eq_reserve_power = pyo.Constraint(m.t, m.units, 
             rule=lambda m, t, u: m.varReserve[t,u] >= m.varPower[t,u])
         # Reserve < Max Power
-        m.eq_reserve_max_power = Constraint(m.t, m.units, 
+        m.eq_reserve_max_power = pyo.Constraint(m.t, m.units, 
             rule=lambda m, t, u: m.varReserve[t,u] <= system[u].max_power * m.binIsOn[t, u])
         # Reserve ramp up
-        m.eq_reserve_ramp_up = Constraint(m.t, m.units, 
-            rule=lambda m, t, u: (
-            Constraint.Skip if (system[u].ramp_up is None or t == m.t.first())
-            else m.varReserve[t, u] <= m.varPower[t-1, u] + system[u].ramp_up * m.binIsOn[t-1,u] + system[u].min_power * m.binStartUp[t,u]
-            )
-        )
+        def eq_reserve_ramp_up(m, t, u):
+            previous = self._previous(t, u)
+            if system[u].ramp_up is None or previous is None:
+                return pyo.Constraint.Skip
+            return m.varReserve[t, u] <= previous[1] + system[u].ramp_up * previous[0] + system[u].min_power * m.binStartUp[t,u]
+        m.eq_reserve_ramp_up = pyo.Constraint(m.t, m.units, rule=eq_reserve_ramp_up)
         # Reserve ramp down
-        m.eq_reserve_ramp_up = Constraint(m.t, m.units, 
+        m.eq_reserve_ramp_down = pyo.Constraint(m.t, m.units, 
             rule=lambda m, t, u: (
-            Constraint.Skip if (system[u].ramp_up is None or t == m.t.last())
-            else m.varReserve[t, u] <= system[u].min_power * m.binShutDown[t+1,u] + system[u].min_power * (m.binIsOn[t,u] - m.binShutDown[t+1,u])  
+            pyo.Constraint.Skip if (system[u].ramp_up is None or t == m.t.last())
+            else m.varReserve[t, u] <= system[u].min_power * m.binShutDown[t+1,u] + system[u].max_power * (m.binIsOn[t,u] - m.binShutDown[t+1,u])  
             )
         )
         self.m = m
 
     # Power Balance
     def _build_balance_equations(self, load):
+        import pyomo.environ as pyo
         m = self.m
-        system = self.system
+        m.paramLoad = pyo.Param(m.t, mutable=True, initialize=self._load_values(load))
         # Power reserve
-        m.eq_balance_power = Constraint(m.t, 
-            rule=lambda m, t: sum(m.varPower[t,u] for u in m.units) >= load[t]
+        m.eq_balance_power = pyo.Constraint(m.t, 
+            rule=lambda m, t: sum(m.varPower[t,u] for u in m.units) >= m.paramLoad[t]
             )
-        r = system.reserve_req
+        r = self._reserve_req()
         if 1 > r > 0:
             # Power reserve
-            m.eq_balance_reserve = Constraint(m.t, 
-                rule=lambda m, t: sum(m.varReserve[t,u] for u in m.units) >= load[t] * (1+r)
+            m.eq_balance_reserve = pyo.Constraint(m.t, 
+                rule=lambda m, t: sum(m.varReserve[t,u] for u in m.units) >= m.paramLoad[t] * (1+m.paramReserveReq)
                 )
         self.m = m
         
+    def _load_values(self, load):
+        return dict(enumerate(load))
+
+    def _horizon(self, load):
+        return len(load)
+
+    def _model_structure(self, load):
+        r = self._reserve_req()
+        initial = tuple(sorted((u, tuple(s)) for u, s in (self.initial_state or {}).items()))
+        return (self._horizon(load), r == 0, 1 > r > 0, self.system.fleet, initial)
+
+    def _update_parameters(self, load, fuel_cost=None):
+        m = self.m
+        if load is not None:
+            m.paramLoad.store_values(self._load_values(load))
+        fuel_cost = fuel_cost or {}
+        for u in self.system:
+            m.paramFuelCost[u.name] = fuel_cost.get(u.name, u.fuel_cost)
+        if self._reserve_req() != 0:
+            m.paramReserveReq = self._reserve_req()
+
     def _build_model(self, load):
-        self.m   = ConcreteModel()
-        self.m.t = Set(initialize=list(range(len(load))), ordered=True)
-        
+        import pyomo.environ as pyo
+        self.m   = pyo.ConcreteModel()
+        self.m.t = pyo.Set(initialize=list(range(len(load))), ordered=True)
         
-        self._build_units_equations()
-        self._build_reserve_equations()
-        self._build_balance_equations(load)
+        with self._phase('units_equations'):
+            self._build_units_equations()
+        with self._phase('reserve_equations'):
+            self._build_reserve_equations()
+        with self._phase('balance_equations'):
+            self._build_balance_equations(load)
 
 
 class LPModel(BaseModel):
-    def __init__(self, *args, **kwargs):
+    # The fuel consumption is linearised by num_lines support lines per unit,
+    # the chords of its input-output curve. With fuel_tol the support lines
+    # are instead num_lines tangents, and after each solve a tangent is
+    # added at every (t, unit) whose fuel is underestimated by more than
+    # fuel_tol (relative) before solving again, at most max_cut_rounds times.
+    # start, an on status [T, units], is the starting point of the next
+    # solve, e.g. the previous window of a rolling horizon. With
+    # start_power, the powers [T, units] of that commitment, the start is a
+    # complete incumbent (fuel and reserve included), as given by
+    # PriorityListModel.warm_start (see there for its effect with HiGHS).
+    def __init__(self, *args, num_lines=2, fuel_tol=None, max_cut_rounds=20, **kwargs):
         super(LPModel, self).__init__(*args, **kwargs)
-    
-    def _build_linear_objective(self, num_lines=2):
+        self.num_lines = num_lines
+        self.fuel_tol = fuel_tol
+        self.max_cut_rounds = max_cut_rounds
+        self.fuel_cuts = []
+        self.start = None
+        self.start_power = None
+
+    def _cache_inputs(self):
+        inputs = super()._cache_inputs()
+        inputs.update(num_lines=self.num_lines, fuel_tol=self.fuel_tol, max_cut_rounds=self.max_cut_rounds,
+                      start=None if self.start is None else np.asarray(self.start) > .5,
+                      start_power=self.start_power)
+        return inputs
+
+    def _build_linear_objective(self):
+        import pyomo.environ as pyo
         m = self.m
-        system = self.system
-        m.varFuelCons = Var(m.t, m.units, domain=NonNegativeReals)
-        m.support_lines = ConstraintList()
-        num_lines = num_lines
-        for t in m.t:
-            for u in m.units:
-                p = np.linspace(system[u].min_power, system[u].max_power, num_lines+1)
-                fp = system[u].input_output(p)
-                for i in range(num_lines):
-                    m.support_lines.add(
-                        m.varFuelCons[t, u]
-                        >=
-                        fp[i] * m.binIsOn[t,u]
-                        + (fp[i+1] - fp[i])/(p[i+1]-p[i]) * (m.varPower[t, u] - p[i])
-                        )
-        m.cost = Objective(
-            expr = sum(m.varFuelCons[t, u.name] * u.fuel_cost for u in system for t in m.t)
+        system = self._model_system()
+        fleet = system.fleet
+        m.varFuelCons = pyo.Var(m.t, m.units, domain=pyo.NonNegativeReals)
+        m.paramFuelCost = pyo.Param(m.units, mutable=True, initialize={u.name: u.fuel_cost for u in system})
+        # Lines computed once per unit and shared by every time step
+        if self.fuel_tol is None:
+            intercept, slope = fleet.support_lines(self.num_lines)
+        else:
+            intercept, slope = fleet.tangent_lines(np.linspace(fleet.min_power, fleet.max_power, self.num_lines).T)
+        m.segments = pyo.Set(initialize=range(intercept.shape[1]))
+        m.support_lines = pyo.Constraint(m.t, m.units, m.segments, rule=lambda m, t, u, k: (
+            m.varFuelCons[t, u] >= intercept[fleet.index[u], k] * m.binIsOn[t, u] + slope[fleet.index[u], k] * m.varPower[t, u]))
+        m.fuel_cuts = pyo.ConstraintList()
+        m.cost = pyo.Objective(
+            expr = sum(m.varFuelCons[t, u.name] * m.paramFuelCost[u.name] for u in system for t in m.t)
                    + sum(m.binStartUp[t, u.name] * u.start_up_cost for u in system for t in m.t)
-                   , sense = minimize,
+                   , sense = pyo.minimize,
         )
         self.m = m
 
     def _build_model(self, load):
         super()._build_model(load)
-        self._build_linear_objective()
+        with self._phase('linear_objective'):
+            self._build_linear_objective()
         
-    def solve(self, load, tee=0, exec="./solvers/cbc/cbc.exe"):
-        self._build_model(load)    
-        sol = SolverFactory("cbc", executable=exec)
-        sol.options["ratio"] = 0.01
-        sol.options["sec"] = 200
-        res = sol.solve(self.m, tee=tee)
-        status = (res.solver.status == SolverStatus.ok) and (res.solver.termination_condition == TerminationCondition.optimal)
-        val = value(self.m.cost) if status else None
-        return status, val
-    
+    def solve(self, load, tee=0, exec=None, fuel_cost=None, reserve_req=None):
+        # fuel_cost ({unit: cost}) and reserve_req override the system values.
+        # exec, a solver executable, overrides the solver of the model.
+        self.report = RunReport(self.hooks)
+        key, hit = self._cache_lookup(load, exec, fuel_cost, reserve_req)
+        if hit is not None:
+            return hit
+        self.reserve_req = reserve_req
+        structure = self._model_structure(load)
+        reuse = self.persistent and self.m is not None and structure == self._structure
+        if reuse:
+            with self._phase('update_parameters'):
+                self._update_parameters(load, fuel_cost)
+        else:
+            self._build_model(load)
+            self._structure = structure
+            if fuel_cost:
+                with self._phase('update_parameters'):
+                    self._update_parameters(None, fuel_cost)
+        # The previous solution is the starting point of the new solve
+        if self.start is not None:
+            self._set_start(self.start, self.start_power)
+        status = self._solve_refined(tee, exec, warmstart=reuse or self.start is not None)
+        val = self._objective() if status else None
+        return self._cache_store(key, status, val)
+
+    def _objective(self):
+        import pyomo.environ as pyo
+        return pyo.value(self.m.cost)
+
+    def _set_start(self, on, power=None):
+        # Binary values of the on status (numbers of units on with counts),
+        # start ups and shut downs, and with power the powers, the fuel on
+        # the support lines and the largest reserve the constraints allow
+        import pyomo.environ as pyo
+        m = self.m
+        fleet = self._model_system().fleet
+        on = np.rint(np.asarray(on, dtype=float))
+        previous = np.array([on[0, i] if self._initial(u) is None else self._count(u) * (self._initial(u).status > 0)
+                             for i, u in enumerate(fleet.names)])
+        previous = np.vstack([previous, on[:-1]])
+        for (t, u), var in m.binIsOn.items():
+            i = fleet.index[u]
+            var.set_value(int(on[t, i]))
+            m.binStartUp[t, u].set_value(int(max(on[t, i] - previous[t, i], 0)))
+            m.binShutDown[t, u].set_value(int(max(previous[t, i] - on[t, i], 0)))
+        if power is None:
+            return
+        # Fuel of the units on sharing the power equally
+        power = np.where(on > 0, power, 0)
+        p = power / np.maximum(on, 1)
+        fuel = fleet.input_output(p.T).T
+        if self.fuel_tol is None:
+            # The chords are above the curves, the tangents below
+            intercept, slope = fleet.support_lines(self.num_lines)
+            fuel = np.maximum(fuel, (intercept[None] + slope[None] * p[..., None]).max(axis=2))
+        for (t, u), var in m.varPower.items():
+            i = fleet.index[u]
+            var.set_value(power[t, i])
+            m.varFuelCons[t, u].set_value(on[t, i] * fuel[t, i])
+        if hasattr(m, 'varReserve'):
+            limits = [m.eq_reserve_max_power, m.eq_reserve_ramp_up, m.eq_reserve_ramp_down]
+            for index, var in m.varReserve.items():
+                # Bodies are reserve - bound <= 0: the bound is -body at 0
+                var.set_value(0)
+                var.set_value(min(pyo.value(c[index].upper) - pyo.value(c[index].body) for c in limits if index in c))
+
+    def _solve_refined(self, tee, exec, warmstart=False):
+        # Solve, then add fuel cuts and solve again until the tangents are
+        # within fuel_tol of the curves at the solution
+        status = self._solve_model(tee, exec, warmstart)
+        if self.fuel_tol is None:
+            return status
+        m = self.m
+        fleet = self._model_system().fleet
+        shape = (len(m.t), len(m.units))
+        units = list(m.units)
+        self.fuel_cuts = []
+        for it in range(self.max_cut_rounds):
+            if not status:
+                break
+            start = time.perf_counter()
+            # Tangents at the power of each unit on, sharing the power
+            # equally with counts
+            on = np.rint(_array(m.binIsOn, shape))
+            power = _array(m.varPower, shape) / np.maximum(on, 1)
+            fuel = on * fleet.input_output(power.T).T
+            error = np.where(on > 0, fuel - _array(m.varFuelCons, shape), 0) / np.maximum(np.abs(fuel), 1e-10)
+            violated = np.argwhere(error > self.fuel_tol)
+            self.fuel_cuts.append({'round': it, 'violations': len(violated), 'max_error': error.max(),
+                                   'cuts': len(m.support_lines) + len(m.fuel_cuts), 'time': time.perf_counter() - start})
+            if len(violated) == 0:
+                break
+            with self._phase('fuel_cuts_{}'.format(it)):
+                intercept, slope = fleet.tangent_lines(power.T)
+                for t, i in violated:
+                    u = units[i]
+                    m.fuel_cuts.add(m.varFuelCons[t, u] >= intercept[i, t] * m.binIsOn[t, u] + slope[i, t] * m.varPower[t, u])
+            status = self._solve_model(tee, exec, warmstart=True)
+        return status
+
+    def _solve_model(self, tee, exec=None, warmstart=False):
+        solver = self.solver
+        if exec is not None:
+            solver = get_backend(exec, gap=solver.gap, time_limit=solver.time_limit, threads=solver.threads)
+        status, stats = solver.solve(self.m, tee=tee, warmstart=warmstart)
+        self.report.solved(stats)
+        return status
+
+    def get_results(self, fields=None):
+        # Results with the given fields, by default all of them
+        if self._cached is not None:
+            return self._cached.select(fields)
+        results = Results(len(self.m.t))
+        for name in fields or self._result_fields():
+            getattr(self, '_add_' + name)(results)
+        return results
+
+    def _result_fields(self):
+        return ['power', 'status']
+
+    def _add_power(self, results):
+        m = self.m
+        results.add('power', _array(m.varPower, (len(m.t), len(m.units))), list(m.units), 'Unit', 'Power')
+
+    def _add_status(self, results):
+        m = self.m
+        results.add('status', _array(m.binIsOn, (len(m.t), len(m.units))), list(m.units), 'Unit', 'IsOn')
+
     def get_power(self):
-        data = ((key[0], key[1], val) for key, val in self.m.varPower.extract_values().items())
-        df = pd.DataFrame(data, columns =['Time', 'Unit', 'Power'])
-        return df
+        return self.get_results(['power']).long('power', categorical=False)
 
 class DCModel(LPModel):
-    def __init__(self, network):
-        super(DCModel, self).__init__(system=network.system)
+    # formulation is either 'angle' (bus angles and nodal balances over the
+    # network susceptance matrix) or 'ptdf' (no angles, one system balance
+    # and PTDF flow limits on the monitored lines, by default the lines
+    # with a power limit; a monitored line without one is a ValueError).
+    # With reduce the model is built on the NetworkReduction of the network
+    # for the load being solved, kept in self.reduction. Lines powers and
+    # LMPs are still given for the buses and lines of network; monitored
+    # lines removed by the reduction, or whose limit it dropped, are not
+    # monitored.
+    # LMPs are the duals of the LP with the commitment fixed to the
+    # solution, solved again when the solver gave no duals for the MIP.
+    def __init__(self, network, formulation='angle', monitored=None, persistent=False, initial_state=None,
+                 hooks=None, reduce=False, **kwargs):
+        super(DCModel, self).__init__(system=network.system, persistent=persistent,
+                                      initial_state=initial_state, hooks=hooks, **kwargs)
+        if formulation not in ('angle', 'ptdf'):
+            raise ValueError("Unknown formulation {}".format(formulation))
         self.network = network
+        self.formulation = formulation
+        self.monitored = monitored
+        self.reduce = reduce
+        self.reduction = None
+        self.load = None
+
+    def _grid(self):
+        # Network the model is built on
+        return self.network if self.reduction is None else self.reduction.network
+
+    def _cache_inputs(self):
+        inputs = super()._cache_inputs()
+        inputs.update(network=self.network, formulation=self.formulation, monitored=self.monitored,
+                      reduce=self.reduce)
+        return inputs
 
     def _build_balance_equations(self, load):
+        import pyomo.environ as pyo
         m = self.m
-        network = self.network
-        m.buses = Set(initialize=network.buses)
-        m.arcs = Set(initialize=network.lines.keys())
+        network = self._grid()
+        self.load = load
+        m.buses = pyo.Set(initialize=network.buses)
+        m.arcs = pyo.Set(initialize=network.lines.keys())
+        m.paramLoad = pyo.Param(m.t, m.buses, mutable=True, initialize=self._load_values(load))
 
         def busOut_init(m, bus):
             for i, j in m.arcs:
                 if i == bus:
                     yield j
-        m.busOut = Set(m.buses, initialize=busOut_init)
+        m.busOut = pyo.Set(m.buses, initialize=busOut_init)
 
         def busIn_init(m, bus):
             for i, j in m.arcs:
                 if j == bus:
                     yield i
-        m.busIn = Set(m.buses, initialize=busIn_init)
-    
+        m.busIn = pyo.Set(m.buses, initialize=busIn_init)
+
+        if self.formulation == 'angle':
+            self._build_angle_equations()
+        else:
+            self._build_ptdf_equations()
+
+        r = self._reserve_req()
+        if 1 > r > 0:
+            m.eq_flow_reserve = pyo.Constraint(m.t, m.buses,
+                rule=lambda m, t, bus:
+                    sum(m.varReserve[t,u] for u in m.units) \
+                        >= m.paramLoad[t,bus] * (1+m.paramReserveReq)
+                )
+        self.m = m
 
-        m.varAngle = Var(m.t, m.buses, domain=Reals, initialize=0)
+    def _build_angle_equations(self):
+        import pyomo.environ as pyo
+        m = self.m
+        network = self._grid()
+        m.varAngle = pyo.Var(m.t, m.buses, domain=pyo.Reals, initialize=0)
         for tt in m.t:
             m.varAngle[tt, m.buses.first()].fix(0)
         def flow_limit_up(m, t, a, b):
-            if network.power_lim(a,b) is None:
-                return Constraint.Skip
-            return network.Z(a,b) * (m.varAngle[t, a] - m.varAngle[t, b]) <= network.power_lim(a,b)
-        m.eq_flow_limits_up = Constraint(m.t, m.arcs, rule=flow_limit_up) 
+            if network[a,b].power_lim is None:
+                return pyo.Constraint.Skip
+            return network[a,b].Z * (m.varAngle[t, a] - m.varAngle[t, b]) <= network[a,b].power_lim
+        m.eq_flow_limits_up = pyo.Constraint(m.t, m.arcs, rule=flow_limit_up) 
         def flow_limit_lo(m, t, a, b):
-            if network.power_lim(a,b) is None:
-                return Constraint.Skip
-            return network.Z(a,b) * (m.varAngle[t, a] - m.varAngle[t, b]) >= - network.power_lim(a,b)
-        m.eq_flow_limits_lo = Constraint(m.t, m.arcs, rule=flow_limit_lo) 
+            if network[a,b].power_lim is None:
+                return pyo.Constraint.Skip
+            return network[a,b].Z * (m.varAngle[t, a] - m.varAngle[t, b]) >= - network[a,b].power_lim
+        m.eq_flow_limits_lo = pyo.Constraint(m.t, m.arcs, rule=flow_limit_lo) 
 
+        # Nodal balance over the non zero entries of the susceptance matrix,
+        # as one expression == 0 so that the duals of the buses with and
+        # without units have the same sign
+        bbus = network.bbus()
+        buses = network.buses
+        index = {b: k for k, b in enumerate(buses)}
         def eq_flow_balance(m, t, bus):
-            demand = load.get(bus, None)
-            demand = 0 if demand is None else demand[t]
+            k = index[bus]
+            row = slice(bbus.indptr[k], bbus.indptr[k+1])
             return sum(m.varPower[t, u] for u in m.units if network.link(bus, u)) \
-                - demand \
-                == sum(network.Z(bus, i) * (m.varAngle[t, bus] - m.varAngle[t, i])
-                        for i in m.buses if i != bus)
-        m.eq_flow_balance = Constraint(m.t, m.buses, rule=eq_flow_balance)
-        
-        r = network.system.reserve_req
-        if 1 > r > 0:
-            m.eq_flow_reserve = Constraint(m.t, m.buses,
-                rule=lambda m, t, bus:
-                    sum(m.varReserve[t,u] for u in m.units) \
-                        >= load[bus][t] * (1+r)
-                )
-        self.m = m
+                - m.paramLoad[t, bus] \
+                - sum(val * m.varAngle[t, buses[i]]
+                        for i, val in zip(bbus.indices[row], bbus.data[row])) == 0
+        m.eq_flow_balance = pyo.Constraint(m.t, m.buses, rule=eq_flow_balance)
+
+    def _build_ptdf_equations(self):
+        import pyomo.environ as pyo
+        m = self.m
+        network = self._grid()
+        arcs = list(network.lines)
+        if self.monitored is None:
+            monitored = network.monitored()
+        else:
+            monitored = [arc for arc in self.network.monitored(self.monitored)
+                         if arc in network.lines and network[arc].power_lim is not None]
+        m.monitored = pyo.Set(initialize=monitored, within=m.arcs)
+
+        # Injection shift factors of the units and flows due to the demand,
+        # a parameter updated with the load
+        ptdf = network.ptdf()
+        rows = [arcs.index(arc) for arc in monitored]
+        links = np.array([[network.link(bus, u) for u in m.units] for bus in network.buses], dtype=float)
+        shift = ptdf[rows] @ links
+        self._monitored_ptdf = ptdf[rows]
+        m.paramBaseFlow = pyo.Param(m.t, m.monitored, mutable=True, initialize=self._base_flow_values(self.load))
+        loaded = np.any(np.abs(self._monitored_ptdf) > 1e-10, axis=1)
+
+        m.eq_flow_balance = pyo.Constraint(m.t,
+            rule=lambda m, t: sum(m.varPower[t, u] for u in m.units) == sum(m.paramLoad[t, b] for b in m.buses)
+            )
+        # A line no unit shifts onto still bounds the flow of the demand: its
+        # rows have no variables and are infeasible when that flow is over
+        # the limit. The flow of the units is built once for both rows, over
+        # float factors (numpy scalars go through a slow path in Pyomo).
+        units = list(m.units)
+        line = {arc: l for l, arc in enumerate(monitored)}
+        terms = [[(float(shift[l, k]), u) for k, u in enumerate(units) if abs(shift[l, k]) > 1e-10]
+                 for l in range(len(monitored))]
+        flows = {}
+        def flow(m, t, l):
+            if (t, l) not in flows:
+                flows[t, l] = sum(f * m.varPower[t, u] for f, u in terms[l])
+            return flows[t, l]
+        def flow_limit_up(m, t, a, b):
+            l = line[a, b]
+            if not terms[l] and not loaded[l]:
+                return pyo.Constraint.Skip
+            return flow(m, t, l) - m.paramBaseFlow[t, a, b] <= network[a,b].power_lim
+        m.eq_flow_limits_up = pyo.Constraint(m.t, m.monitored, rule=flow_limit_up)
+        def flow_limit_lo(m, t, a, b):
+            l = line[a, b]
+            if not terms[l] and not loaded[l]:
+                return pyo.Constraint.Skip
+            return flow(m, t, l) - m.paramBaseFlow[t, a, b] >= - network[a,b].power_lim
+        m.eq_flow_limits_lo = pyo.Constraint(m.t, m.monitored, rule=flow_limit_lo)
+
+    def _load_values(self, load):
+        T = self._horizon(load)
+        if self.reduction is not None:
+            load = self.reduction.aggregate(load)
+        return {(t, b): (load[b][t] if b in load else 0) for b in self._grid().buses for t in range(T)}
+
+    def _base_flow_values(self, load):
+        # Flows of the demand on the monitored lines, ptdf @ demand
+        T = self._horizon(load)
+        network = self._grid()
+        if self.reduction is not None:
+            load = self.reduction.aggregate(load)
+        demand = np.array([load[b] if b in load else np.zeros(T) for b in network.buses], dtype=float)
+        flows = demand.T @ self._monitored_ptdf.T
+        return {(t, a, b): flows[t, l] for l, (a, b) in enumerate(self.m.monitored) for t in range(T)}
+
+    def _model_structure(self, load):
+        structure = super()._model_structure(load)
+        if self.reduce:
+            structure += (NetworkReduction(self.network, load).key,)
+        return structure
+
+    def _horizon(self, load):
+        return len(list(load.values())[0])
+
+    def _update_parameters(self, load, fuel_cost=None):
+        if load is not None:
+            self.load = load
+        super()._update_parameters(load, fuel_cost)
+        if load is not None and self.formulation == 'ptdf':
+            self.m.paramBaseFlow.store_values(self._base_flow_values(load))
 
     def _build_model(self, load):
-        self.m   = ConcreteModel()
-        T = len(list(load.values())[0])
-        self.m.t = Set(initialize=list(range(T)), ordered=True)
+        import pyomo.environ as pyo
+        self.m   = pyo.ConcreteModel()
+        T = self._horizon(load)
+        self.m.t = pyo.Set(initialize=list(range(T)), ordered=True)
+        self.reduction = None
+        if self.reduce:
+            with self._phase('network_reduction'):
+                self.reduction = NetworkReduction(self.network, load)
         
-        self._build_units_equations()
-        self._build_reserve_equations()
-        self._build_balance_equations(load)
-        self._build_linear_objective()
+        with self._phase('units_equations'):
+            self._build_units_equations()
+        with self._phase('reserve_equations'):
+            self._build_reserve_equations()
+        with self._phase('balance_equations'):
+            self._build_balance_equations(load)
+        with self._phase('linear_objective'):
+            self._build_linear_objective()
 
-        self.m.dual = Suffix(direction=Suffix.IMPORT)
+        self.m.dual = pyo.Suffix(direction=pyo.Suffix.IMPORT)
 
-    def get_lmp(self):
-        # return a nested dictionary {bus : {t: dual}}
-        data = {b : {t: self.m.dual[self.m.eq_flow_balance[t,b]] for t in self.m.t} for b in self.m.buses}
+    def _result_fields(self):
+        return super()._result_fields() + ['lines_power', 'lmp']
 
-        data = ((t, b, lmp) for b, val in data.items() for t, lmp in val.items())
-        df = pd.DataFrame(data, columns =['Time', 'Node', 'LMP'])
-        return df
+    def _fixed_duals(self):
+        # Duals of the LP with the commitment fixed to the MIP solution. The
+        # fixed variables are made continuous too, as some solvers (APPSI
+        # HiGHS) still solve a MIP, without duals, with integers fixed.
+        import pyomo.environ as pyo
+        m = self.m
+        fixed = [(v, v.domain) for v in m.component_data_objects(pyo.Var) if v.is_integer() and not v.fixed]
+        for v, _ in fixed:
+            v.domain = pyo.Reals
+            v.fix(round(v.value))
+        try:
+            with self._phase('fixed_lp'):
+                status = self._solve_model(0)
+        finally:
+            for v, domain in fixed:
+                v.unfix()
+                v.domain = domain
+        if not status:
+            raise RuntimeError("The LP with the commitment fixed has no solution, no LMPs")
 
-    def get_lines_power(self):
+    def _add_lmp(self, results):
+        m = self.m
+        T = len(m.t)
+        if not len(m.dual):
+            self._fixed_duals()
+        if self.formulation == 'ptdf':
+            # lmp[t, b] = lambda[t] + sum over monitored lines of ptdf[l, b] * mu[t, l]
+            network = self._grid()
+            arcs = list(network.lines)
+            monitored = list(m.monitored)
+            ptdf = network.ptdf()[[arcs.index(arc) for arc in monitored]]
+            lam = _array(m.eq_flow_balance, T, (m.dual.get(c) for c in m.eq_flow_balance.values()))
+            line = {arc: l for l, arc in enumerate(monitored)}
+            mu = np.zeros((T, len(monitored)))
+            for limits in (m.eq_flow_limits_up, m.eq_flow_limits_lo):
+                for (t, a, b), c in limits.items():
+                    mu[t, line[a, b]] += m.dual.get(c, 0)
+            lmp = lam[:, None] + mu @ ptdf
+        else:
+            lmp = _array(m.eq_flow_balance, (T, len(m.buses)),
+                         (m.dual.get(c) for c in m.eq_flow_balance.values()))
+        if self.reduction is not None:
+            congestion = {}
+            for limits in (m.eq_flow_limits_up, m.eq_flow_limits_lo):
+                for (t, a, b), c in limits.items():
+                    congestion.setdefault((a, b), np.zeros(T))[t] -= m.dual.get(c, 0)
+            lmp = self.reduction.lmp(lmp, congestion)
+        results.add('lmp', lmp, list(self.network.buses), 'Node', 'LMP')
+
+    def _add_lines_power(self, results):
+        results.add('lines_power', self._lines_power(), list(self.network.lines), ('Node A', 'Node B'), 'Power')
+
+    def _lines_power(self):
+        # Flows [T, lines] of the lines of the network, from the bus
+        # injections unless the model has the angles of its buses
+        m = self.m
         network = self.network
-        data = {(a,b) : {t: (value(self.m.varAngle[t, a]) - value(self.m.varAngle[t, b])) * network.Z(a,b)
-                        for t in self.m.t} for a,b in self.m.arcs}
-        data = ((t, a, b, power) for (a,b), val in data.items() for t, power in val.items())
-        df = pd.DataFrame(data, columns =['Time', 'Node A', 'Node B', 'Power'])
-        return df
+        T = len(m.t)
+        if self.formulation == 'ptdf' or self.reduction is not None:
+            links = np.array([[network.link(bus, u) for u in m.units] for bus in network.buses], dtype=float)
+            power = _array(m.varPower, (T, len(m.units)))
+            demand = np.array([self.load[b] if b in self.load else np.zeros(T) for b in network.buses], dtype=float)
+            flows = (power @ links.T - demand.T) @ network.ptdf().T
+        else:
+            import scipy.sparse as sp
+            angle = _array(m.varAngle, (T, len(m.buses)))
+            flows = angle @ (network.incidence().T @ sp.diags(network.susceptance()))
+        return flows
+
+    def get_lmp(self):
+        return self.get_results(['lmp']).long('lmp', order='item', categorical=False)
+
+    def get_lines_power(self):
+        return self.get_results(['lines_power']).long('lines_power', order='item', categorical=False)
 
 
 class SCDCModel(DCModel):
     def __init__(self, *args, **kwargs):
         super(SCDCModel, self).__init__(*args, **kwargs)
+        if self.formulation != 'angle':
+            raise ValueError("SCDCModel requires the 'angle' formulation")
 
     def _build_security_constraints(self, load, contingencies='all'):
+        import pyomo.environ as pyo
         m = self.m
         network = self.network
         system = network.system
 
         if contingencies == 'all':
-            m.contingencies = SetOf(m.arcs)
+            m.contingencies = pyo.SetOf(m.arcs)
         else:
-            m.contingencies = Set(within=m.arcs, initialize=contingencies)
-        m.varPowerC = Var(m.t, m.units, m.contingencies, domain=NonNegativeReals)
+            m.contingencies = pyo.Set(within=m.arcs, initialize=contingencies)
+        m.varPowerC = pyo.Var(m.t, m.units, m.contingencies, domain=pyo.NonNegativeReals)
             
         # Ramp Equations
         def eq_contingency_ramp_up(m, t, u, ca, cb):
             if  system[u].ramp_up is None or t == m.t.first():
-                return Constraint.Skip
+                return pyo.Constraint.Skip
             else:
                 return m.varPowerC[t, u, ca, cb] - m.varPowerC[t-1, u, ca, cb] <= system[u].ramp_up * m.binIsOn[t-1,u] + system[u].min_power * m.binStartUp[t,u]
         
         def eq_contingency_ramp_down(m, t, u, ca, cb):
             if  system[u].ramp_down is None or t == m.t.first():
-                return Constraint.Skip
+                return pyo.Constraint.Skip
             else:
                 return m.varPowerC[t-1, u, ca, cb] - m.varPowerC[t, u, ca, cb] <= system[u].ramp_down * m.binIsOn[t,u] + system[u].min_power * m.binShutDown[t,u]
-        m.eq_contingency_ramp_up = Constraint(m.t, m.units, m.contingencies, rule=eq_contingency_ramp_up)
-        m.eq_contingency_ramp_down = Constraint(m.t, m.units, m.contingencies, rule=eq_contingency_ramp_down)
+        m.eq_contingency_ramp_up = pyo.Constraint(m.t, m.units, m.contingencies, rule=eq_contingency_ramp_up)
+        m.eq_contingency_ramp_down = pyo.Constraint(m.t, m.units, m.contingencies, rule=eq_contingency_ramp_down)
 
         # Min Max Power
         def eq_contingency_min_power(m, t, u, ca, cb):
             return m.varPowerC[t, u, ca, cb] >= system[u].min_power * m.binIsOn[t, u]
         def eq_contingency_max_power(m, t, u, ca, cb):
             return m.varPowerC[t, u, ca, cb] <= system[u].max_power * m.binIsOn[t, u]
-        m.eq_contingency_min_power = Constraint(m.t, m.units, m.contingencies, rule=eq_contingency_min_power)
-        m.eq_contingency_max_power = Constraint(m.t, m.units, m.contingencies, rule=eq_contingency_max_power)
+        m.eq_contingency_min_power = pyo.Constraint(m.t, m.units, m.contingencies, rule=eq_contingency_min_power)
+        m.eq_contingency_max_power = pyo.Constraint(m.t, m.units, m.contingencies, rule=eq_contingency_max_power)
             
         # Raction Rate Equations
         def eq_contingency_react_up(m, t, u, ca, cb):
             return m.varPowerC[t, u, ca, cb] <= m.varPower[t, u] + system[u].ramp_up
         def eq_contingency_react_down(m, t, u, ca, cb):
             return  m.varPowerC[t, u, ca, cb] >= m.varPower[t, u] - system[u].ramp_down
-        m.eq_contingency_react_up = Constraint(m.t, m.units, m.contingencies, rule=eq_contingency_react_up)
-        m.eq_contingency_react_down = Constraint(m.t, m.units, m.contingencies, rule=eq_contingency_react_down)
+        m.eq_contingency_react_up = pyo.Constraint(m.t, m.units, m.contingencies, rule=eq_contingency_react_up)
+        m.eq_contingency_react_down = pyo.Constraint(m.t, m.units, m.contingencies, rule=eq_contingency_react_down)
 
 
-        m.varAngleC = Var(m.t, m.buses, m.contingencies, domain=Reals, initialize=0)
+        m.varAngleC = pyo.Var(m.t, m.buses, m.contingencies, domain=pyo.Reals, initialize=0)
         for c in m.contingencies:
             for tt in m.t:
                 m.varAngleC[tt, m.buses.first(), c].fix(0)
         def contingencies_flow_limit_up(m, t, a, b, ca, cb):
             if network.power_lim(a,b) is None or (a,b) == (ca, cb):
-                return Constraint.Skip
-            return network.Z(a, b) * (m.varAngleC[t, a, ca, cb] - m.varAngleC[t, b, ca, cb]) <= network.power_lim(a,b)
-        m.eq_contingencies_flow_limits_up = Constraint(m.t, m.arcs, m.contingencies, rule=contingencies_flow_limit_up) 
+                return pyo.Constraint.Skip
+            return network[a,b].Z * (m.varAngleC[t, a, ca, cb] - m.varAngleC[t, b, ca, cb]) <= network.power_lim(a,b)
+        m.eq_contingencies_flow_limits_up = pyo.Constraint(m.t, m.arcs, m.contingencies, rule=contingencies_flow_limit_up) 
         def contingencies_flow_limit_lo(m, t, a, b, ca, cb):
             if network.power_lim(a,b) is None or (a,b) == (ca, cb):
-                return Constraint.Skip
-            return network.Z(a, b) * (m.varAngleC[t, a, ca, cb] - m.varAngleC[t, b, ca, cb]) >= - network.power_lim(a,b)
-        m.eq_contingencies_flow_limits_lo = Constraint(m.t, m.arcs, m.contingencies, rule=contingencies_flow_limit_lo) 
+                return pyo.Constraint.Skip
+            return network[a,b].Z * (m.varAngleC[t, a, ca, cb] - m.varAngleC[t, b, ca, cb]) >= - network.power_lim(a,b)
+        m.eq_contingencies_flow_limits_lo = pyo.Constraint(m.t, m.arcs, m.contingencies, rule=contingencies_flow_limit_lo) 
 
 
         def contingencies_eq_flow_balance(m, t, bus, ca, cb):
-            demand = load.get(bus, None)
-            demand = 0 if demand is None else demand[t]
             return sum(m.varPowerC[t, u, ca, cb] for u in m.units if network.link(bus, u)) \
-                - demand \
-                == sum((0 if (bus, i) == (ca,cb) else network.Z(bus, i)) * (m.varAngleC[t, bus, ca, cb] - m.varAngleC[t, i, ca, cb])
-                        for i in m.buses if i != bus)
-        m.eq_contingencies_flow_balance = Constraint(m.t, m.buses, m.contingencies, rule=contingencies_eq_flow_balance)
+                - m.paramLoad[t, bus] \
+                == sum(network[bus, i].Z * (m.varAngleC[t, bus, ca, cb] - m.varAngleC[t, i, ca, cb])
+                        for i in m.busOut[bus] if (bus, i) != (ca, cb)) \
+                - sum(network[i, bus].Z * (m.varAngleC[t, i, ca, cb] - m.varAngleC[t, bus, ca, cb])
+                        for i in m.busIn[bus] if (i, bus) != (ca, cb))
+        m.eq_contingencies_flow_balance = pyo.Constraint(m.t, m.buses, m.contingencies, rule=contingencies_eq_flow_balance)
     
         # # Fix flow C in lane at 0
         # m.eq_contingencies_fix_zero = Constraint(m.t, m.contingencies,
@@ -339,14 +821,138 @@ class SCDCModel(DCModel):
         
     def _build_model(self, load, contingencies):
         super()._build_model(load)
-        self._build_security_constraints(load, contingencies)
+        with self._phase('security_constraints'):
+            self._build_security_constraints(load, contingencies)
         
-    def solve(self, load, contingencies='all', tee=0, exec="./solvers/cbc/cbc.exe"):
+    def solve(self, load, contingencies='all', tee=0, exec=None,
+              screening=False, max_rounds=20, tol=1e-6):
+        # With screening, the base DCModel is solved first and corrective
+        # dispatch and flow limits are only added for the contingencies,
+        # lines and time steps found violated, until none are left.
+        # A reduced network (reduce) only works with screening, whose
+        # contingencies are on the lines of the original network. A
+        # violation no unit can relieve, the flow of the demand alone, is
+        # infeasible: the solve fails with the (t, outage, line) in the
+        # 'infeasible' entry of the last round of self.screening.
+        import pyomo.environ as pyo
+        self.report = RunReport(self.hooks)
+        if self.reduce and not screening:
+            raise ValueError("SCDCModel with reduce requires screening")
+        key, hit = self._cache_lookup(load, contingencies, exec, screening, max_rounds, tol)
+        if hit is not None:
+            return hit
+        if screening:
+            return self._cache_store(key, *self._solve_screening(load, contingencies, tee, exec, max_rounds, tol))
         self._build_model(load, contingencies)    
-        sol = SolverFactory("cbc", executable=exec)
-        sol.options["ratio"] = 0.01
-        sol.options["sec"] = 200
-        res = sol.solve(self.m, tee=tee)
-        status = (res.solver.status == SolverStatus.ok) and (res.solver.termination_condition == TerminationCondition.optimal)
-        val = value(self.m.cost) if status else None
-        return status, val
\ No newline at end of file
+        status = self._solve_refined(tee, exec)
+        val = pyo.value(self.m.cost) if status else None
+        return self._cache_store(key, status, val)
+
+    def _solve_screening(self, load, contingencies, tee, exec, max_rounds, tol):
+        import pyomo.environ as pyo
+        network = self.network
+        arcs = list(network.lines)
+        super()._build_model(load)
+        m = self.m
+        if contingencies == 'all':
+            contingencies = arcs
+        m.contingencies = pyo.Set(within=None if self.reduction else m.arcs, initialize=contingencies)
+        m.security_cuts = pyo.ConstraintList()
+
+        # Outages that island the network are not screened
+        with self._phase('ptdf_lodf'):
+            ptdf = network.ptdf()
+            lodf, islanding = network.lodf(ptdf)
+        outages = np.array([arcs.index(arc) for arc in contingencies], dtype=int)
+        outages = outages[~islanding[outages]]
+        lim = np.array([np.inf if l.power_lim is None else l.power_lim for l in network.lines.values()])
+        links = np.array([[network.link(bus, u) for u in m.units] for bus in network.buses], dtype=float)
+        demand = np.array([load[b] if b in load else np.zeros(len(m.t)) for b in network.buses], dtype=float)
+        units = list(m.units)
+        column = {k: c for c, k in enumerate(outages)}
+
+        self.corrective = {}
+        self.screening = []
+        for it in range(max_rounds):
+            start = time.perf_counter()
+            status = self._solve_refined(tee, exec)
+            if not status:
+                break
+            # Post contingency flows (lines x outages x t), computed from the
+            # corrective dispatch of the outages already in the model
+            power = np.array([[pyo.value(m.varPower[t, u]) for u in units] for t in m.t])
+            flows = ptdf @ (links @ power.T - demand)
+            post = flows[:, None, :] + lodf[:, outages, None] * flows[outages][None, :, :]
+            for k, var in self.corrective.items():
+                pk = np.array([[pyo.value(var[t, u]) for u in units] for t in m.t])
+                fk = ptdf @ (links @ pk.T - demand)
+                post[:, column[k], :] = fk + lodf[:, k, None] * fk[k]
+            violated = np.argwhere(np.abs(post) > lim[:, None, None] + tol)
+            self.screening.append({'round': it, 'violations': len(violated),
+                                   'active_outages': len(self.corrective), 'active_cuts': len(m.security_cuts),
+                                   'time': time.perf_counter() - start})
+            if len(violated) == 0:
+                break
+            with self._phase('security_cuts_{}'.format(it)):
+                fixed = self._add_security_cuts(it, [(t, outages[c], l) for l, c, t in violated],
+                                                ptdf, lodf, links, demand)
+            if fixed:
+                self.screening[-1]['infeasible'] = [(int(t), arcs[k], arcs[l]) for t, k, l in fixed]
+                status = False
+                break
+        val = pyo.value(m.cost) if status else None
+        converged = status and self.screening[-1]['violations'] == 0
+        return converged, val
+
+    def _add_security_cuts(self, it, triples, ptdf, lodf, links, demand):
+        # Corrective dispatch of the newly violated outages over the whole
+        # horizon, as in _build_security_constraints, and flow limits on the
+        # violated (outage, line, t) with the post outage shift factors.
+        # Returns the violated triples without units on the line, whose
+        # post outage flow is the flow of the demand alone.
+        import pyomo.environ as pyo
+        m = self.m
+        system = self.system
+        network = self.network
+        arcs = list(network.lines)
+        units = list(m.units)
+        new = sorted({k for _, k, _ in triples if k not in self.corrective})
+        if new:
+            b = pyo.Block()
+            m.add_component('security_{}'.format(it), b)
+            b.outages = pyo.Set(initialize=new)
+            b.varPowerC = pyo.Var(m.t, m.units, b.outages, domain=pyo.NonNegativeReals)
+            b.eq_ramp_up = pyo.Constraint(m.t, m.units, b.outages,
+                rule=lambda b, t, u, k: pyo.Constraint.Skip if system[u].ramp_up is None or t == m.t.first()
+                    else b.varPowerC[t, u, k] - b.varPowerC[t-1, u, k] <= system[u].ramp_up * m.binIsOn[t-1,u] + system[u].min_power * m.binStartUp[t,u])
+            b.eq_ramp_down = pyo.Constraint(m.t, m.units, b.outages,
+                rule=lambda b, t, u, k: pyo.Constraint.Skip if system[u].ramp_down is None or t == m.t.first()
+                    else b.varPowerC[t-1, u, k] - b.varPowerC[t, u, k] <= system[u].ramp_down * m.binIsOn[t,u] + system[u].min_power * m.binShutDown[t,u])
+            b.eq_min_power = pyo.Constraint(m.t, m.units, b.outages,
+                rule=lambda b, t, u, k: b.varPowerC[t, u, k] >= system[u].min_power * m.binIsOn[t, u])
+            b.eq_max_power = pyo.Constraint(m.t, m.units, b.outages,
+                rule=lambda b, t, u, k: b.varPowerC[t, u, k] <= system[u].max_power * m.binIsOn[t, u])
+            b.eq_react_up = pyo.Constraint(m.t, m.units, b.outages,
+                rule=lambda b, t, u, k: pyo.Constraint.Skip if system[u].ramp_up is None
+                    else b.varPowerC[t, u, k] <= m.varPower[t, u] + system[u].ramp_up)
+            b.eq_react_down = pyo.Constraint(m.t, m.units, b.outages,
+                rule=lambda b, t, u, k: pyo.Constraint.Skip if system[u].ramp_down is None
+                    else b.varPowerC[t, u, k] >= m.varPower[t, u] - system[u].ramp_down)
+            b.eq_balance = pyo.Constraint(m.t, b.outages,
+                rule=lambda b, t, k: sum(b.varPowerC[t, u, k] for u in m.units) == demand[:, t].sum())
+            for k in new:
+                self.corrective[k] = {(t, u): b.varPowerC[t, u, k] for t in m.t for u in units}
+        fixed = []
+        for t, k, l in triples:
+            factors = ptdf[l] + lodf[l, k] * ptdf[k]
+            terms = [(f, u) for f, u in zip(factors @ links, units) if abs(f) > 1e-10]
+            if not terms:
+                fixed.append((t, k, l))
+                continue
+            base_flow = factors @ demand[:, t]
+            lim = network[arcs[l]].power_lim
+            m.security_cuts.add(pyo.inequality(base_flow - lim,
+                                           sum(f * self.corrective[k][t, u] for f, u in terms),
+                                           base_flow + lim))
+        return fixed
+
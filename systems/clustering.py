@@ -0,0 +1,103 @@
+import numpy as np
+
+from .core import UCSystem
+from .thermal import ThermalUnit, UnitState
+
+
+class UnitClustering(object):
+    # Groups of identical thermal units of a system, for a unit commitment
+    # over integer numbers of units instead of a binary per unit, which
+    # removes the symmetry between the units of a group. Units are grouped
+    # when their min power, min up and down times and initial state are the
+    # same and their curve, fuel cost, max power, ramps and start up cost
+    # are within rtol of the first unit of the group (relative).
+    #
+    # system holds one unit per group, named after its first unit, with the
+    # mean curve and costs and the tightest limits of the group, members
+    # its unit names, count their number and initial_state its state.
+    #
+    # disaggregate turns the numbers of units of each group on, starting up
+    # and shutting down into the on status of its units.
+    def __init__(self, system, initial_state=None, rtol=0):
+        self.original = system
+        self.rtol = rtol
+        self._initial_state = initial_state or {}
+        fleet = system.fleet
+        values = np.column_stack([fleet.curve, fleet.fuel_cost, fleet.max_power, fleet.start_up_cost,
+                                  fleet.ramp_up, fleet.ramp_down])
+        exact = [(p, up, rest, self._state(u)) for u, p, up, rest in
+                 zip(fleet.names, fleet.min_power, fleet.min_uptime, fleet.min_rest)]
+        groups = {}
+        self.members = {}
+        for i, u in enumerate(fleet.names):
+            for first in groups.setdefault(exact[i], []):
+                if np.all(np.isclose(values[i], values[fleet.index[first]], rtol=rtol, atol=0)):
+                    self.members[first].append(u)
+                    break
+            else:
+                groups[exact[i]].append(u)
+                self.members[u] = [u]
+        self.count = {name: len(units) for name, units in self.members.items()}
+        self.system = UCSystem([self._unit(name, units) for name, units in self.members.items()],
+                               system.reserve_req)
+        self.initial_state = {name: self._state(name) for name in self.members if self._state(name) is not None}
+
+    def _state(self, u):
+        state = self._initial_state.get(u)
+        return None if state is None else UnitState(*state)
+
+    def _unit(self, name, units):
+        # Mean curve and costs, tightest limits and ramps of the units
+        units = [self.original[u] for u in units]
+        ramp_up = min((u.ramp_up for u in units if u.ramp_up is not None), default=None)
+        ramp_down = min((u.ramp_down for u in units if u.ramp_down is not None), default=None)
+        return ThermalUnit(name, list(np.mean([u.curve for u in units], axis=0)),
+                           np.mean([u.fuel_cost for u in units]),
+                           min_power=units[0].min_power, max_power=min(u.max_power for u in units),
+                           start_up_cost=np.mean([u.start_up_cost for u in units]),
+                           ramp_up=ramp_up, ramp_down=ramp_down,
+                           min_uptime=units[0].min_uptime, min_rest=units[0].min_rest)
+
+    def disaggregate(self, on, start, shut):
+        # On status [T, units] of the original units from the numbers [T,
+        # groups] of units of each group on, starting up and shutting down,
+        # groups in the order of system. Units shut down the longest on first
+        # and start up the longest off first, which keeps their min up and
+        # down times whenever the numbers of LPModel do. Raises ValueError
+        # when they do not.
+        fleet = self.original.fleet
+        T = len(on)
+        status = np.zeros((T, len(fleet)), dtype=bool)
+        for k, (name, members) in enumerate(self.members.items()):
+            unit = self.system[name]
+            up, rest = unit.min_uptime or 0, unit.min_rest or 0
+            units = [fleet.index[u] for u in members]
+            state = self._state(name)
+            # Period each unit turned on (on) or off (off); the first units
+            # on in the first period when the state is unknown
+            if state is None:
+                first, count = 1, int(on[0, k])
+                since = {i: -np.inf for i in units}
+                lit = set(units[:count])
+                status[0, list(lit)] = True
+            else:
+                first = 0
+                since = {i: -state.status if state.status > 0 else state.status for i in units}
+                lit = set(units) if state.status > 0 else set()
+            for t in range(first, T):
+                stopping = sorted(lit, key=since.get)[:int(shut[t, k])]
+                starting = sorted(set(units) - lit, key=since.get)[:int(start[t, k])]
+                if len(stopping) < shut[t, k] or any(t - since[i] < up for i in stopping):
+                    raise ValueError("Group {} has no unit to shut down at {}".format(name, t))
+                if len(starting) < start[t, k] or any(t - since[i] < rest for i in starting):
+                    raise ValueError("Group {} has no unit to start up at {}".format(name, t))
+                for i in stopping:
+                    lit.discard(i)
+                    since[i] = t
+                for i in starting:
+                    lit.add(i)
+                    since[i] = t
+                if len(lit) != on[t, k]:
+                    raise ValueError("Group {} is not {} units on at {}".format(name, int(on[t, k]), t))
+                status[t, list(lit)] = True
+        return status
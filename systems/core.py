@@ -1,14 +1,52 @@
 from functools import reduce
+import weakref
 import numpy as np
-import matplotlib.pyplot as plt
 
 class Unit(object):
     def __init__(self, name):
+        self._systems = weakref.WeakSet()
         self.name = name
 
+    def __setattr__(self, key, value):
+        super().__setattr__(key, value)
+        # Drop the cached fleet arrays of the systems holding this unit
+        if not key.startswith('_'):
+            for system in list(self.__dict__.get('_systems', ())):
+                system._fleet = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_systems']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.__dict__['_systems'] = weakref.WeakSet()
+
 class System(object):
     def __init__(self, units):
         self.units = {u.name: u for u in units}
+        self._fleet = None
+        for u in self.units.values():
+            u._systems.add(self)
+
+    @property
+    def fleet(self):
+        # Array view of the units, rebuilt only after a unit was mutated
+        if self._fleet is None:
+            from .thermal import ThermalFleet
+            self._fleet = ThermalFleet(self)
+        return self._fleet
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_fleet'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        for u in self.units.values():
+            u._systems.add(self)
 
     def __iter__(self):
         for u in self.units.values():
@@ -18,6 +56,7 @@ class System(object):
         return self.units[key]
 
     def plot_input_output(self):
+        import matplotlib.pyplot as plt
         for name, u in self.units.items():   
             pp = np.linspace(u.min_power, u.max_power, 30)
             plt.plot(pp, u.input_output(pp), label=name)
@@ -67,6 +106,16 @@ class Network(object):
 
     def link(self, bus, unit):
         return (bus, unit) in self.links
+
+    def monitored(self, arcs=None):
+        # Lines with flow limits: arcs, by default the lines with a power
+        # limit. Raises ValueError for a line of arcs without one.
+        if arcs is None:
+            return [arc for arc, line in self.lines.items() if line.power_lim is not None]
+        for arc in arcs:
+            if self[arc].power_lim is None:
+                raise ValueError("Monitored line {} has no power limit".format(arc))
+        return list(arcs)
     
     def power_lim(self, a, b):
         line = self.lines.get((a,b), self.lines.get((b,a), None))
@@ -80,4 +129,53 @@ class Network(object):
         if line is None:
             return 1
         else:
-            return line.Z
\ No newline at end of file
+            return line.Z
+
+    def incidence(self):
+        # Sparse (lines x buses) incidence: +1 at the from bus, -1 at the to bus
+        index = {b: i for i, b in enumerate(self.buses)}
+        L = len(self.lines)
+        rows = np.repeat(np.arange(L), 2)
+        cols = [index[b] for arc in self.lines for b in arc]
+        vals = np.tile([1., -1.], L)
+        import scipy.sparse as sp
+        return sp.csr_matrix((vals, (rows, cols)), shape=(L, len(self.buses)))
+
+    def susceptance(self):
+        return np.array([l.Z for l in self.lines.values()], dtype=float)
+
+    def bbus(self):
+        # Nodal susceptance matrix A' diag(Z) A, over the actual lines only
+        import scipy.sparse as sp
+        A = self.incidence()
+        return (A.T @ sp.diags(self.susceptance()) @ A).tocsr()
+
+    def ptdf(self, slack=None):
+        # Dense (lines x buses) power transfer distribution factors for
+        # injections withdrawn at the slack bus (first bus by default)
+        import scipy.sparse as sp
+        from scipy.sparse.linalg import splu
+        slack = self.buses.index(self.buses[0] if slack is None else slack)
+        keep = np.arange(len(self.buses)) != slack
+        A = self.incidence()
+        Bf = sp.diags(self.susceptance()) @ A
+        Bred = self.bbus()[keep][:, keep].tocsc()
+        ptdf = np.zeros(A.shape)
+        if Bred.shape[0]:
+            ptdf[:, keep] = splu(Bred).solve(Bf[:, keep].T.toarray()).T
+        return ptdf
+
+    def lodf(self, ptdf=None):
+        # Dense (lines x lines) line outage distribution factors: change of
+        # the flow on line l per unit of pre-outage flow on line k when k is
+        # tripped, and the mask of the lines whose outage islands the network,
+        # whose columns are NaN but for the -1 of the diagonal.
+        ptdf = self.ptdf() if ptdf is None else ptdf
+        transfer = ptdf @ self.incidence().T.toarray()
+        denom = 1 - np.diag(transfer)
+        islanding = np.abs(denom) < 1e-8
+        with np.errstate(divide='ignore', invalid='ignore'):
+            lodf = transfer / denom
+        lodf[:, islanding] = np.nan
+        np.fill_diagonal(lodf, -1)
+        return lodf, islanding
@@ -0,0 +1,203 @@
+import numpy as np
+
+from .core import Line, Network
+
+
+def _flow_bounds(ptdf, lo, hi):
+    # Largest and smallest flow of each line over the bus injections in
+    # [lo, hi] that sum to zero: a continuous knapsack per line, injections
+    # raised from lo in decreasing (increasing) order of their shift factor
+    need = max(-lo.sum(), 0)
+    cap = hi - lo
+    base = ptdf @ lo
+    bounds = []
+    for order in (np.argsort(-ptdf, axis=1), np.argsort(ptdf, axis=1)):
+        c = cap[order]
+        raised = np.clip(need - (np.cumsum(c, axis=1) - c), 0, c)
+        bounds.append(base + (np.take_along_axis(ptdf, order, axis=1) * raised).sum(axis=1))
+    return bounds
+
+
+class NetworkReduction(object):
+    # Smaller equivalent of a network for the DC models, with the same
+    # optimal dispatch:
+    #  - limits that no injection within the unit capacities and the load
+    #    range can reach are dropped (needs load, {bus: series})
+    #  - radial buses behind an unlimited line, or without injection, are
+    #    merged into their neighbour with their units and load
+    #  - buses without units or load are eliminated (Kron): between two
+    #    lines, replaced by one line with the tighter limit, or at the centre
+    #    of unlimited lines, replaced by the lines between their neighbours
+    #    when that does not add lines
+    # Without load every bus is taken as loaded and no limit is dropped.
+    #
+    # network is the reduced Network and bus_map maps each bus to the bus it
+    # was merged into, None when eliminated. aggregate and lmp carry loads
+    # and prices between the two networks. The flows of the original lines
+    # follow from the bus injections and its PTDF.
+    #
+    #   reduction = NetworkReduction(network, load)
+    #   model = DCModel(reduction.network)
+    #   model.solve(reduction.aggregate(load))
+    def __init__(self, network, load=None, tol=1e-9):
+        self.original = network
+        self.tol = tol
+        self.bus_map = {b: b for b in network.buses}
+        self.dropped_limits = []
+        self._records = []
+        self._lines = {arc: [l.power_lim, l.Z] for arc, l in network.lines.items()}
+        self._units = {b: set() for b in network.buses}
+        for b, u in network.links:
+            if b in self._units:
+                self._units[b].add(u)
+        self._injecting = {b: bool(self._units[b]) or load is None or
+                           (b in load and bool(np.any(np.asarray(load[b]) != 0))) for b in network.buses}
+        self._adjacent = {b: {} for b in network.buses}
+        for a, b in network.lines:
+            self._adjacent[a].setdefault(b, []).append((a, b))
+            self._adjacent[b].setdefault(a, []).append((a, b))
+
+        if load is not None:
+            self._drop_limits(load)
+        changed = True
+        while changed:
+            changed = False
+            for b in list(self._adjacent):
+                if len(self._lines) <= 1:
+                    break
+                if b in self._adjacent and (self._merge_radial(b) or self._eliminate(b)):
+                    changed = True
+
+        links = {(self.bus_map[b], u) for b, u in network.links if self.bus_map.get(b) is not None}
+        self.network = Network([Line(arc, lim, Z) for arc, (lim, Z) in self._lines.items()], network.system, links)
+        self.key = (tuple(self.bus_map.items()), tuple((arc, lim, Z) for arc, (lim, Z) in self._lines.items()))
+
+    def _drop_limits(self, load):
+        network = self.original
+        T = len(next(iter(load.values())))
+        capacity = {u.name: u.max_power for u in network.system}
+        lo = np.zeros(len(network.buses))
+        hi = np.zeros(len(network.buses))
+        for k, b in enumerate(network.buses):
+            demand = np.asarray(load[b], dtype=float) if b in load else np.zeros(T)
+            lo[k] = -demand.max()
+            hi[k] = sum(capacity[u] for u in self._units[b]) - demand.min()
+        fmax, fmin = _flow_bounds(network.ptdf(), lo, hi)
+        for l, arc in enumerate(network.lines):
+            lim = self._lines[arc][0]
+            if lim is not None and fmax[l] <= lim + self.tol and fmin[l] >= -lim - self.tol:
+                self._lines[arc][0] = None
+                self.dropped_limits.append(arc)
+
+    def _remove_bus(self, k, into):
+        for arcs in self._adjacent.pop(k).values():
+            for a, b in arcs:
+                del self._lines[a, b]
+                other = b if a == k else a
+                self._adjacent[other].pop(k, None)
+        for b, mapped in self.bus_map.items():
+            if mapped == k:
+                self.bus_map[b] = into
+
+    def _merge_radial(self, s):
+        # Radial bus into its neighbour, when the line between them cannot
+        # be congested
+        if len(self._adjacent[s]) != 1:
+            return False
+        (n, arcs), = self._adjacent[s].items()
+        if len(arcs) != 1 or (self._lines[arcs[0]][0] is not None and self._injecting[s]):
+            return False
+        self._remove_bus(s, n)
+        self._units[n] |= self._units.pop(s)
+        self._injecting[n] = self._injecting[n] or self._injecting.pop(s)
+        self._records.append(('merge', s, n))
+        return True
+
+    def _add_line(self, i, j, Z, lim):
+        # Line i-j, in parallel with an existing unlimited one if any
+        arcs = self._adjacent[i].get(j, [])
+        if arcs:
+            self._lines[arcs[0]][1] += Z
+            return
+        self._lines[i, j] = [lim, Z]
+        self._adjacent[i][j] = [(i, j)]
+        self._adjacent[j][i] = [(i, j)]
+
+    def _parallel_free(self, i, j):
+        # No line i-j yet, or a single unlimited one
+        arcs = self._adjacent[i].get(j, [])
+        return not arcs or (len(arcs) == 1 and self._lines[arcs[0]][0] is None)
+
+    def _eliminate(self, k):
+        # Bus without injection between two lines, or at the centre of
+        # unlimited lines (star-mesh transform)
+        neighbours = self._adjacent[k]
+        if self._injecting[k] or len(neighbours) < 2 or any(len(arcs) != 1 for arcs in neighbours.values()):
+            return False
+        arcs = {j: arcs[0] for j, arcs in neighbours.items()}
+        Z = {j: self._lines[arc][1] for j, arc in arcs.items()}
+        lim = {j: self._lines[arc][0] for j, arc in arcs.items()}
+        total = sum(Z.values())
+        weights = [(j, z / total) for j, z in Z.items()]
+        if len(arcs) == 2:
+            (i, li), (j, lj) = lim.items()
+            limited = [x for x in (li, lj) if x is not None]
+            if not self._parallel_free(i, j) or (limited and self._adjacent[i].get(j)):
+                return False
+            # The flow i-j is the flow through k, within the limit of the
+            # tighter of the two lines
+            tight = arcs[i] if li is not None and (lj is None or li <= lj) else arcs[j]
+            self._remove_bus(k, None)
+            self._add_line(i, j, Z[i] * Z[j] / total, min(limited) if limited else None)
+            self._records.append(('series', k, weights, (i, j), tight))
+            return True
+        pairs = [(i, j) for n, i in enumerate(arcs) for j in list(arcs)[n + 1:]]
+        new = sum(1 for i, j in pairs if not self._adjacent[i].get(j))
+        if any(l is not None for l in lim.values()) or new > len(arcs) or \
+                not all(self._parallel_free(i, j) for i, j in pairs):
+            return False
+        self._remove_bus(k, None)
+        for i, j in pairs:
+            self._add_line(i, j, Z[i] * Z[j] / total, None)
+        self._records.append(('kron', k, weights))
+        return True
+
+    def aggregate(self, load):
+        # {reduced bus: load} of {bus: load}
+        reduced = {}
+        for b, series in load.items():
+            mapped = self.bus_map.get(b)
+            if mapped is not None:
+                series = np.asarray(series, dtype=float)
+                reduced[mapped] = reduced[mapped] + series if mapped in reduced else series
+        return reduced
+
+    def lmp(self, lmp, congestion):
+        # Prices [T, buses] of the original buses from the prices [T, reduced
+        # buses] and the congestion prices {line: [T]} of the reduced lines,
+        # positive when the flow a -> b of line (a, b) is at its limit. A bus
+        # eliminated between lines i-k-j has the Z weighted average of the
+        # prices of i and j, plus the share of the congestion price of i-j
+        # that the injection at k moves onto the tighter line.
+        price = {b: lmp[:, i] for i, b in enumerate(self.network.buses)}
+        congestion = {arc: np.asarray(c, dtype=float) for arc, c in congestion.items()}
+        zero = np.zeros(len(lmp))
+        for record in reversed(self._records):
+            kind, k = record[:2]
+            if kind == 'merge':
+                price[k] = price[record[2]]
+                continue
+            weights = record[2]
+            price[k] = sum(w * price[j] for j, w in weights)
+            if kind == 'series':
+                (i, wi), (j, wj) = weights
+                arc, tight = record[3], record[4]
+                nu = congestion.get(arc, zero)
+                # Injected at k, the flow i -> k falls by wi and k -> j rises by wj
+                if i in tight:
+                    price[k] = price[k] + wi * nu
+                    congestion[tight] = nu if tight == (i, k) else -nu
+                else:
+                    price[k] = price[k] - wj * nu
+                    congestion[tight] = nu if tight == (k, j) else -nu
+        return np.column_stack([price[b] for b in self.original.buses])
@@ -1,6 +1,11 @@
+from collections import namedtuple
 from .core import Unit
 import numpy as np
 
+# State of a unit before the first period of a unit commitment: status is
+# the number of hours it has been on (> 0) or off (< 0), power its last output
+UnitState = namedtuple('UnitState', ['status', 'power'])
+
 class ThermalUnit(Unit):
     def __init__(self, name, input_output, fuel_cost,
                     min_power=-np.inf, max_power=np.inf,
@@ -31,3 +36,68 @@ class ThermalUnit(Unit):
 
     def inv_marginal_cost(self, x):
         return (x / self.fuel_cost - self.curve[1]) / 2 / (self.curve[2] + 1e-7)
+
+
+class ThermalFleet(object):
+    # Struct of arrays view of a set of thermal units. Unit dependent
+    # quantities are arrays of shape (units,) and the curve methods take
+    # arrays of shape (units, ...) so that all units evaluate at once.
+    def __init__(self, units):
+        units = list(units)
+        self.names = [u.name for u in units]
+        self.index = {name: i for i, name in enumerate(self.names)}
+        self.curve = np.array([u.curve for u in units], dtype=float).reshape(len(units), 3)
+        self.fuel_cost = np.array([u.fuel_cost for u in units], dtype=float)
+        self.min_power = np.array([u.min_power for u in units], dtype=float)
+        self.max_power = np.array([u.max_power for u in units], dtype=float)
+        self.start_up_cost = np.array([u.start_up_cost for u in units], dtype=float)
+        # Missing ramps are unlimited, missing up/down times are no constraint
+        self.ramp_up = np.array([np.inf if u.ramp_up is None else u.ramp_up for u in units], dtype=float)
+        self.ramp_down = np.array([np.inf if u.ramp_down is None else u.ramp_down for u in units], dtype=float)
+        self.min_uptime = np.array([u.min_uptime or 0 for u in units], dtype=int)
+        self.min_rest = np.array([u.min_rest or 0 for u in units], dtype=int)
+        for value in vars(self).values():
+            if isinstance(value, np.ndarray):
+                value.setflags(write=False)
+
+    def __len__(self):
+        return len(self.names)
+
+    def _column(self, coef, P):
+        # Broadcast a per unit coefficient along the trailing axes of P
+        return coef.reshape(coef.shape + (1,) * (np.ndim(P) - 1))
+
+    def input_output(self, P):
+        a, b, c = (self._column(self.curve[:, i], P) for i in range(3))
+        return a + b * P + c * P * P
+
+    def net_heatrate(self, P):
+        return self.input_output(P) / (P + 1e-7) * 1000
+
+    def marginal_heatrate(self, P):
+        b, c = (self._column(self.curve[:, i], P) for i in (1, 2))
+        return b + c * P * 2
+
+    def marginal_cost(self, P):
+        return self.marginal_heatrate(P) * self._column(self.fuel_cost, P)
+
+    def support_lines(self, num_lines):
+        # Chords of the input-output curves over num_lines equal segments of
+        # [min_power, max_power], as (intercept, slope) of shape (units, num_lines)
+        p = np.linspace(self.min_power, self.max_power, num_lines + 1).T
+        fp = self.input_output(p)
+        slope = np.diff(fp, axis=1) / np.diff(p, axis=1)
+        return fp[:, :-1] - slope * p[:, :-1], slope
+
+    def tangent_lines(self, P):
+        # Tangents of the input-output curves at the powers P of shape
+        # (units, ...), as (intercept, slope) of the same shape. They are
+        # below the convex curves everywhere.
+        slope = self.marginal_heatrate(P)
+        return self.input_output(P) - slope * P, slope
+
+    def inv_marginal_cost(self, x):
+        # x holds system lambdas: the result has shape (units,) + x.shape
+        x = np.asarray(x, dtype=float)[None, ...]
+        b, c = (self._column(self.curve[:, i], x) for i in (1, 2))
+        return (x / self._column(self.fuel_cost, x) - b) / 2 / (c + 1e-7)
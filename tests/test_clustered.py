@@ -0,0 +1,60 @@
+import numpy as np
+import pytest
+
+from ..benchmarks.generators import random_load, random_system
+from ..solvers.backends import get_backend
+from ..solvers.clustered import ClusteredLPModel
+from ..solvers.unit_commitment import LPModel
+from ..systems.thermal import UnitState
+
+
+def _state(system):
+    # Two groups on for an hour near their ramp limits, one off for an hour
+    return {u.name: UnitState(1, .6 * u.max_power) if i % 3 else UnitState(-1, 0) for i, u in enumerate(system)}
+
+
+def _fixed(system, state, load, results):
+    # LPModel with the schedule of the results fixed
+    fixed = LPModel(system, initial_state=state, solver=get_backend(None, gap=1e-9))
+    fixed._build_model(load)
+    names = system.fleet.names
+    for (t, u), var in fixed.m.binIsOn.items():
+        var.fix(results['status'][t, names.index(u)])
+    for (t, u), var in fixed.m.varPower.items():
+        var.fix(results['power'][t, names.index(u)])
+    return fixed
+
+
+@pytest.mark.parametrize('seed, initial', [(0, False), (2, False), (1, True), (3, True)])
+def test_clustered_bounds_lp(seed, initial):
+    # The groups bound LPModel from below, the units dispatched again from
+    # their commitment from above
+    system = random_system(6, seed=seed, types=3)
+    load = random_load(12, system, seed=seed)
+    state = _state(system) if initial else None
+    lp = LPModel(system, initial_state=state, solver=get_backend(None, gap=1e-9))
+    clustered = ClusteredLPModel(system, initial_state=state, solver=get_backend(None, gap=1e-9))
+    status, cost = lp.solve(load)
+    assert status
+    status, clustered_cost = clustered.solve(load)
+    assert status and clustered.repair in ('dispatch', 'commitment')
+    assert clustered.bound <= cost * (1 + 1e-6)
+    assert clustered_cost >= cost * (1 - 1e-6)
+
+    # The schedule of the units is feasible for LPModel at that cost
+    results = clustered.get_results()
+    fixed = _fixed(system, state, load, results)
+    assert fixed._solve_model(0)
+    assert fixed.m.cost() == pytest.approx(clustered_cost, rel=1e-6)
+    assert np.all(results['power'].sum(axis=1) >= np.asarray(load) - 1e-6)
+
+
+def test_clustered_without_identical_units():
+    # Groups of one unit: LPModel itself, without a dispatch
+    system = random_system(6, seed=0)
+    load = random_load(12, system, seed=0)
+    status, cost = LPModel(system, solver=get_backend(None, gap=1e-9)).solve(load)
+    clustered = ClusteredLPModel(system, solver=get_backend(None, gap=1e-9))
+    assert clustered.solve(load) == (status, pytest.approx(cost, rel=1e-6))
+    assert len(clustered.clustering.members) == 6 and clustered.dispatch is None
+    assert clustered.get_results()['status'].shape == (12, 6)
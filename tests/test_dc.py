@@ -0,0 +1,44 @@
+import numpy as np
+import pytest
+
+from ..benchmarks.generators import random_load, random_network, random_system
+from ..solvers.backends import get_backend
+from ..solvers.matrix import MatrixDCModel
+from ..solvers.unit_commitment import DCModel, SCDCModel
+from ..systems.core import Line, Network
+
+
+@pytest.mark.parametrize('topology, buses, congestion, seed', [
+    ('radial', 14, .8, 0),   # infeasible, from the flow of the demand alone
+    ('radial', 8, .7, 0),
+    ('radial', 8, .7, 2),
+    ('meshed', 10, .85, 0),
+    ('grid', 9, .8, 2),
+])
+def test_formulations_agree(topology, buses, congestion, seed):
+    # Same feasibility and cost for the angle and PTDF formulations of
+    # DCModel and MatrixDCModel on congested networks
+    system = random_system(8, seed=seed)
+    network = random_network(system, buses, topology, seed=seed, congestion=congestion)
+    load = random_load(6, system, buses=network.buses, seed=seed)
+    status, cost = DCModel(network, solver=get_backend(None, gap=1e-9)).solve(load)
+    expected = (status, pytest.approx(cost, rel=1e-6) if status else None)
+    assert DCModel(network, formulation='ptdf', solver=get_backend(None, gap=1e-9)).solve(load) == expected
+    for formulation in ('angle', 'ptdf'):
+        assert MatrixDCModel(network, formulation=formulation).solve(load, gap=1e-9) == expected
+
+
+def test_screening_reports_demand_violations():
+    # All the units at the reference bus: once line (0, 1) is out, line
+    # (0, 2) carries the whole load, over its limit, and no unit can
+    # relieve it
+    system = random_system(4, seed=0)
+    load = random_load(4, system, seed=0)
+    network = Network([Line((0, 1), 1e4), Line((0, 2), .9 * load.max()), Line((1, 2), 1e4)], system,
+                      {(0, u.name) for u in system})
+    bus_load = {0: np.zeros(4), 1: load / 2, 2: load / 2}
+    model = SCDCModel(network)
+    assert model.solve(bus_load, screening=True) == (False, None)
+    assert len(model.screening) == 1
+    assert {(outage, line) for _, outage, line in model.screening[-1]['infeasible']} == {((0, 1), (0, 2))}
+    assert SCDCModel(network).solve(bus_load) == (False, None)
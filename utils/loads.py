@@ -1,4 +1,203 @@
+import json
+import os
+
 import numpy as np
 
-def simple_load(T, mean, range):
-    return (mean - range/2) * np.ones(T) + range * np.random.rand(T)
\ No newline at end of file
+# Hourly shape of a day, relative to the mean load: night valley, morning
+# and evening peaks
+DAILY_SHAPE = np.array([.72, .68, .66, .65, .66, .71, .82, .95, 1.05, 1.1, 1.12, 1.13,
+                        1.12, 1.1, 1.08, 1.07, 1.09, 1.16, 1.25, 1.27, 1.2, 1.08, .93, .8])
+
+
+def simple_load(T, mean, range, seed=None):
+    # Uniform random profile in mean +- range / 2. seed is an int or a
+    # numpy Generator, so that runs are reproducible.
+    rng = np.random.default_rng(seed)
+    return (mean - range/2) * np.ones(T) + range * rng.random(T)
+
+
+def _correlation(correlation, B):
+    # Cholesky factor of the correlation matrix between buses, given as a
+    # matrix or as a single correlation for every pair
+    C = np.asarray(correlation, dtype=float)
+    if C.ndim == 0:
+        C = np.full((B, B), float(C))
+        np.fill_diagonal(C, 1)
+    return np.linalg.cholesky(C)
+
+
+def load_scenarios(n_scenarios, T, buses=1, mean=1., seed=None, shape=DAILY_SHAPE, sigma=.05, rho=.9,
+                   correlation=.6, out=None, chunk=256):
+    # Load scenarios [n_scenarios, T, buses] in one call:
+    #   load[s, t, b] = mean[b] * shape[t % len(shape)] * (1 + x[s, t, b])
+    # with x an AR(1) process in time of coefficient rho and standard
+    # deviation sigma, correlated across buses (correlation is a matrix or
+    # one coefficient for every pair). buses is a number or a list of bus
+    # labels, mean a scalar, one value per bus or a {bus: mean} dict. The
+    # scenarios are drawn from a numpy Generator (seed is an int or a
+    # Generator) chunk by chunk into out, e.g. ScenarioStore.loads, so that
+    # memory stays bounded, and are the same for any chunk size.
+    from scipy.signal import lfilter
+    labels = list(range(buses)) if np.ndim(buses) == 0 else list(buses)
+    B = len(labels)
+    if isinstance(mean, dict):
+        mean = [mean[b] for b in labels]
+    mean = np.broadcast_to(np.asarray(mean, dtype=float), (B,))
+    profile = np.asarray(shape, dtype=float)[np.arange(T) % len(shape)][:, None] * mean
+    lower = _correlation(correlation, B)
+    if out is None:
+        out = np.empty((n_scenarios, T, B))
+    rng = np.random.default_rng(seed)
+    # Innovations scaled so that x is stationary of standard deviation sigma
+    b = [sigma * np.sqrt(1 - rho * rho)]
+    for first in range(0, n_scenarios, chunk):
+        n = min(chunk, n_scenarios - first)
+        eps = rng.standard_normal((n, T, B)) @ lower.T
+        x = lfilter(b, [1, -rho], eps, axis=1, zi=(sigma - b[0]) * eps[:, :1])[0]
+        out[first:first + n] = np.maximum(profile * (1 + x), 0)
+    return out
+
+
+class ScenarioStore(object):
+    # Load scenarios [scenarios, T, buses] in a memory mapped .npy file, with
+    # the bus labels and the scenario probabilities in a .json next to it.
+    # Slices are views on the file: nothing is read until used, and
+    # processes sharing the store each map the same file. A store pickles
+    # as its path, so that workers open it rather than copy it.
+    #
+    #   store = ScenarioStore.create('loads.npy', 5000, 8760, network.buses)
+    #   load_scenarios(5000, 8760, network.buses, mean, seed=1, out=store.loads)
+    #   model.solve(store.scenario(k))
+    def __init__(self, path, mode='r'):
+        self.path = path
+        self.mode = mode
+        self.loads = np.load(path, mmap_mode=mode)
+        with open(self._meta_path(path)) as f:
+            meta = json.load(f)
+        self.buses = [tuple(b) if isinstance(b, list) else b for b in meta['buses']]
+        self.probabilities = np.array(meta['probabilities'])
+
+    @staticmethod
+    def _meta_path(path):
+        return os.path.splitext(path)[0] + '.json'
+
+    @classmethod
+    def create(cls, path, n_scenarios, T, buses, dtype='float32', probabilities=None):
+        buses = list(range(buses)) if np.ndim(buses) == 0 else list(buses)
+        loads = np.lib.format.open_memmap(path, mode='w+', dtype=dtype, shape=(n_scenarios, T, len(buses)))
+        del loads
+        if probabilities is None:
+            probabilities = np.full(n_scenarios, 1 / n_scenarios)
+        with open(cls._meta_path(path), 'w') as f:
+            json.dump({'buses': buses, 'probabilities': list(map(float, probabilities))}, f)
+        return cls(path, mode='r+')
+
+    def __len__(self):
+        return len(self.loads)
+
+    def __getitem__(self, key):
+        return self.loads[key]
+
+    def __getstate__(self):
+        return {'path': self.path}
+
+    def __setstate__(self, state):
+        self.__init__(state['path'])
+
+    def scenario(self, k):
+        # {bus: load} of scenario k, as views on the file, for the DC models
+        return {b: self.loads[k, :, j] for j, b in enumerate(self.buses)}
+
+    def total(self, k):
+        # System load of scenario k, for LPModel
+        return self.loads[k].sum(axis=1, dtype=float)
+
+    def flush(self):
+        if isinstance(self.loads, np.memmap):
+            self.loads.flush()
+
+
+def _distances(X, chunk=1024):
+    # Euclidean distances [S, S] between the S rows of X, by blocks of chunk
+    # rows read from X (e.g. a memory mapped store) so that X is never
+    # loaded whole. D itself is dense: 4 S^2 bytes, 400 MB for 10000
+    # scenarios, and each pair of blocks is read once.
+    S = len(X)
+    starts = range(0, S, chunk)
+
+    def rows(first):
+        block = np.asarray(X[first:first + chunk], dtype=np.float64)
+        return block.reshape(len(block), -1)
+
+    norms = np.concatenate([(block * block).sum(axis=1) for block in map(rows, starts)])
+    D = np.empty((S, S), dtype=np.float32)
+    for first in starts:
+        block = rows(first)
+        for other in starts:
+            if other < first:
+                continue
+            columns = block if other == first else rows(other)
+            d = norms[first:first + chunk, None] + norms[None, other:other + chunk] - 2 * block @ columns.T
+            D[first:first + chunk, other:other + chunk] = np.sqrt(np.maximum(d, 0))
+            D[other:other + chunk, first:first + chunk] = D[first:first + chunk, other:other + chunk].T
+    return D
+
+
+def _redistribute(D, probabilities, selected):
+    # Probability of each selected scenario: its own and those of the
+    # scenarios closest to it
+    nearest = np.argmin(D[:, selected], axis=1)
+    return np.bincount(nearest, weights=probabilities, minlength=len(selected))
+
+
+def _fast_forward(D, p, n):
+    # Forward selection of Heitsch and Romisch: add the scenario that most
+    # reduces the probability weighted distance of the others to the
+    # selected set
+    c = D.copy()
+    left = np.ones(len(D), dtype=bool)
+    selected = []
+    for _ in range(n):
+        z = np.where(left, (p * left).astype(c.dtype) @ c, np.inf)
+        u = int(np.argmin(z))
+        selected.append(u)
+        left[u] = False
+        np.minimum(c, c[:, u:u + 1], out=c)
+    return np.array(selected)
+
+
+def _k_medoids(D, p, medoids, max_iter=100):
+    # Voronoi iteration: assign each scenario to its closest medoid, then move
+    # each medoid to the member of its cluster of least weighted distance
+    for _ in range(max_iter):
+        nearest = np.argmin(D[:, medoids], axis=1)
+        moved = medoids.copy()
+        for k in range(len(medoids)):
+            members = np.flatnonzero(nearest == k)
+            if len(members):
+                moved[k] = members[np.argmin(D[np.ix_(members, members)] @ p[members])]
+        if np.array_equal(np.sort(moved), np.sort(medoids)):
+            break
+        medoids = moved
+    return medoids
+
+
+def reduce_scenarios(loads, n, probabilities=None, method='fast_forward'):
+    # n representative scenarios of loads [scenarios, ...] (e.g. a
+    # ScenarioStore), by fast forward selection or by k-medoids started from
+    # it, on the Euclidean distance between the profiles. Returns their
+    # indices and probabilities, the probability of each scenario left out
+    # going to its closest representative. The distances between all the
+    # scenarios are held in memory, twice for the selection: 8 S^2 bytes.
+    if method not in ('fast_forward', 'kmedoids'):
+        raise ValueError("Unknown method {}".format(method))
+    if isinstance(loads, ScenarioStore):
+        probabilities = loads.probabilities if probabilities is None else probabilities
+        loads = loads.loads
+    S = len(loads)
+    p = np.full(S, 1 / S) if probabilities is None else np.asarray(probabilities, dtype=float)
+    D = _distances(loads)
+    selected = _fast_forward(D, p, min(n, S))
+    if method == 'kmedoids':
+        selected = _k_medoids(D, p, selected)
+    return selected, _redistribute(D, p, selected)